@@ -1,17 +1,97 @@
 from __future__ import annotations
 
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from pathlib import Path
+import hashlib
 import json
-from openai import OpenAI
+import math
+import os
+import re
+import threading
+import time
 
 from .config import Settings
+from .ledger import TokenLedger, get_ledger, read_usage
 from .models import LessonBundle
+from .transport import Transport, get_transport
+
+
+def split_lesson_sections(lesson_markdown: str, min_words: int = 0) -> list[str]:
+    # Split on "## " headings; the title block rides with the first section and
+    # sections shorter than min_words are merged into the previous one.
+    parts = [p.strip() for p in re.split(r"(?m)^(?=## )", lesson_markdown) if p.strip()]
+    if len(parts) > 1 and not parts[0].startswith("## "):
+        parts[1] = parts[0] + "\n\n" + parts[1]
+        parts = parts[1:]
+    sections: list[str] = []
+    for part in parts:
+        if sections and len(part.split()) < min_words:
+            sections[-1] = sections[-1] + "\n\n" + part
+        else:
+            sections.append(part)
+    return sections
+
+
+def allocate_cards(weights: list[int], total: int) -> list[int]:
+    # Largest-remainder split of `total` proportional to `weights`.
+    weight_sum = sum(weights) or 1
+    exact = [total * w / weight_sum for w in weights]
+    counts = [int(x) for x in exact]
+    order = sorted(range(len(weights)), key=lambda i: exact[i] - counts[i], reverse=True)
+    for i in order[: total - sum(counts)]:
+        counts[i] += 1
+    return counts
+
+
+def split_text(text: str, max_chars: int) -> list[str]:
+    # Consecutive pieces of at most max_chars, cut between paragraphs where
+    # possible, else between words; nothing is dropped.
+    if len(text) <= max_chars:
+        return [text]
+    pieces = []
+    for para in re.split(r"(?<=\n\n)", text):
+        if len(para) <= max_chars:
+            pieces.append(para)
+            continue
+        for word in re.findall(r"\S+\s*|\s+", para):
+            pieces.extend(word[i : i + max_chars] for i in range(0, len(word), max_chars))
+    chunks = [""]
+    for piece in pieces:
+        if chunks[-1] and len(chunks[-1]) + len(piece) > max_chars:
+            chunks.append("")
+        chunks[-1] += piece
+    return chunks
+
+
+def _card_key(card: dict) -> str:
+    return re.sub(r"[\W_]+", " ", card.get("front", "")).strip().casefold()
+
+
+def merge_cards(shards: list[list[dict]], limit: int) -> list[dict]:
+    seen: set[str] = set()
+    merged = []
+    for cards in shards:
+        for card in cards:
+            key = _card_key(card)
+            if not key or key in seen:
+                continue
+            seen.add(key)
+            merged.append(card)
+    return merged[:limit]
+
+
+NOTES_PROMPT_VERSION = 1
 
 
 class AIClient:
-    def __init__(self, settings: Settings) -> None:
+    def __init__(
+        self, settings: Settings, transport: Transport | None = None, ledger: TokenLedger | None = None
+    ) -> None:
         if not settings.openai_api_key:
             raise ValueError("OPENAI_API_KEY is missing")
-        self.client = OpenAI(api_key=settings.openai_api_key)
+        transport = transport or get_transport(settings.http)
+        self.client = transport.openai(settings.openai_api_key, settings.openai_base_url)
+        self.ledger = ledger or get_ledger(settings)
         self.model = settings.openai_model
         self.settings = settings
 
@@ -88,7 +168,105 @@ class AIClient:
                     pass
         return {"lesson_markdown": str(lesson).strip(), "cards": normalized_cards}
 
-    def _json_response(self, system_prompt: str, user_payload: dict, schema_name: str, schema: dict, temperature: float) -> dict:
+    def _create(self, stage: str, **kwargs):
+        # Every Responses call goes through the ledger: budget check first, usage recorded after.
+        estimate = len(json.dumps(kwargs.get("input"), ensure_ascii=False)) // 4
+        return self.ledger.call(stage, self.client.responses.create, estimate, **kwargs)
+
+    def _hedge_delay(self, stage: str, model: str) -> float | None:
+        prefs = self.settings.openai
+        if prefs.hedge_max_per_day <= 0:
+            return None
+        latencies = sorted(self.ledger.latencies(stage, model))
+        if len(latencies) < max(1, prefs.hedge_min_samples):
+            return None
+        if self.ledger.calls_today(f"{stage}:hedge") >= prefs.hedge_max_per_day:
+            return None
+        rank = min(len(latencies) - 1, max(0, math.ceil(prefs.hedge_percentile * len(latencies)) - 1))
+        return max(prefs.hedge_min_delay_seconds, latencies[rank] / 1000)
+
+    def _stream_once(self, stage: str, cancel: threading.Event, streams: list, **kwargs):
+        model = str(kwargs.get("model") or "")
+        estimate = len(json.dumps(kwargs.get("input"), ensure_ascii=False)) // 4
+        self.ledger.check(model, estimate)
+        t0 = time.perf_counter()
+        final = None
+        output_chars = 0
+        try:
+            stream = self.client.responses.create(stream=True, **kwargs)
+            # Registered before the first event, so the other request can
+            # close it while it is still waiting for its first token.
+            streams.append(stream)
+            try:
+                for event in () if cancel.is_set() else stream:
+                    if cancel.is_set():
+                        break
+                    if event.type == "response.output_text.delta":
+                        output_chars += len(event.delta or "")
+                    elif event.type == "response.completed":
+                        final = event.response
+                    elif event.type in ("response.failed", "error"):
+                        raise RuntimeError(f"{stage} request failed: {event.type}")
+            finally:
+                stream.close()
+            if final is None:
+                raise RuntimeError(f"{stage} request was cancelled or ended early")
+        except Exception:
+            # A cancelled or failed stream is still billed for its prompt and
+            # whatever it generated; the ledger gets estimates of both.
+            try:
+                self.ledger.record(
+                    stage, model, estimate, output_chars // 4, 0, int((time.perf_counter() - t0) * 1000), ok=False
+                )
+            except Exception:
+                pass
+            raise
+        try:
+            self.ledger.record(
+                stage, str(final.model or model), *read_usage(final), int((time.perf_counter() - t0) * 1000)
+            )
+        except Exception:
+            pass
+        return final
+
+    def _create_hedged(self, stage: str, **kwargs):
+        # If the call has not finished within hedge_percentile of its recent
+        # latencies (from the ledger), a second request goes out, to the
+        # fallback model if set. The first to finish wins; the other stream is
+        # closed, which cancels it server-side. Hedges are capped per day.
+        delay = self._hedge_delay(stage, str(kwargs.get("model") or ""))
+        if delay is None:
+            return self._create(stage, **kwargs)
+        cancel = threading.Event()
+        streams: list = []
+        pool = ThreadPoolExecutor(max_workers=2)
+        try:
+            pending = {pool.submit(self._stream_once, stage, cancel, streams, **kwargs)}
+            done, _ = wait(pending, timeout=delay)
+            if not done:
+                hedge_kwargs = {**kwargs, "model": self.settings.openai.hedge_fallback_model or kwargs.get("model")}
+                pending.add(pool.submit(self._stream_once, f"{stage}:hedge", cancel, streams, **hedge_kwargs))
+            error: Exception | None = None
+            while pending:
+                done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                for fut in done:
+                    try:
+                        return fut.result()
+                    except Exception as e:
+                        error = error or e
+            raise error or RuntimeError(f"{stage} request failed")
+        finally:
+            cancel.set()
+            for stream in list(streams):
+                try:
+                    stream.close()
+                except Exception:
+                    pass
+            pool.shutdown(wait=False)
+
+    def _json_response(
+        self, system_prompt: str, user_payload: dict, schema_name: str, schema: dict, temperature: float, stage: str
+    ) -> dict:
         content = json.dumps(user_payload)
         def _is_temp_unsupported(err: Exception) -> bool:
             msg = str(err).lower()
@@ -115,7 +293,7 @@ class AIClient:
             },
         }
         try:
-            response = self.client.responses.create(**kwargs)
+            response = self._create(stage, **kwargs)
         except TypeError as e:
             if "text" not in str(e).lower() or "unexpected keyword argument" not in str(e).lower():
                 raise
@@ -124,12 +302,12 @@ class AIClient:
                 "type": "json_schema",
                 "json_schema": {"name": schema_name, "schema": schema},
             }
-            response = self.client.responses.create(**kwargs)
+            response = self._create(stage, **kwargs)
         except Exception as e:
             if not _is_temp_unsupported(e):
                 raise
             kwargs.pop("temperature", None)
-            response = self.client.responses.create(**kwargs)
+            response = self._create(stage, **kwargs)
         text = response.output[0].content[0].text
 
         return json.loads(text)
@@ -172,6 +350,7 @@ class AIClient:
             schema_name="plan",
             schema=schema,
             temperature=0,
+            stage="planner",
         )
 
     def generate_lesson(
@@ -182,7 +361,12 @@ class AIClient:
     ) -> str:
         native = self.settings.language.student_native_language
         target = self.settings.language.target_language
-        
+        prefs = self.settings.openai
+        source_chars = sum(len(p.get("text") or "") for p in source_packets)
+        condensed = prefs.map_reduce and source_chars > prefs.map_reduce_threshold_chars
+        if condensed:
+            source_packets = self.condense_packets(source_packets)
+
         prompt = {
             "lesson_type": f"{target} language learning",
             "student_native_language": native,
@@ -200,14 +384,20 @@ class AIClient:
                 f"Main examples must be in {target}.",
                 f"Do not explain grammar fully in {target}.",
                 f"Assume the student is a native {native} speaker."
-            ],
+            ] + (
+                ["lesson_source_text holds condensed teaching notes per source passage; teach from them."]
+                if condensed
+                else []
+            ),
 
             "constraints": {
                 "target_words": target_words,
             },
         }
 
-        response = self.client.responses.create(
+        create = self._create_hedged if self.settings.openai.hedge_lesson else self._create
+        response = create(
+            "lesson",
             model=self.model,
             input=[
                 {
@@ -234,11 +424,176 @@ class AIClient:
 
         return response.output[0].content[0].text.strip()
     
+    def _notes_cache_path(self, packet: dict) -> Path:
+        key = hashlib.sha256(
+            json.dumps(
+                [NOTES_PROMPT_VERSION, self.model, self.settings.language.target_language, packet.get("text") or ""]
+            ).encode("utf-8")
+        ).hexdigest()
+        return self.settings.cache_dir / "notes" / f"{key}.json"
+
+    def condense_packet(self, packet: dict) -> dict:
+        cache = self._notes_cache_path(packet)
+        if cache.exists():
+            return json.loads(cache.read_text(encoding="utf-8"))
+
+        native = self.settings.language.student_native_language
+        target = self.settings.language.target_language
+        schema = {
+            "type": "object",
+            "additionalProperties": False,
+            "properties": {
+                "summary": {"type": "string"},
+                "key_vocabulary": {
+                    "type": "array",
+                    "items": {
+                        "type": "object",
+                        "additionalProperties": False,
+                        "properties": {"term": {"type": "string"}, "meaning": {"type": "string"}},
+                        "required": ["term", "meaning"],
+                    },
+                },
+                "grammar_points": {"type": "array", "items": {"type": "string"}},
+                "example_sentences": {"type": "array", "items": {"type": "string"}},
+            },
+            "required": ["summary", "key_vocabulary", "grammar_points", "example_sentences"],
+        }
+        notes = self._json_response(
+            system_prompt=f"""You condense {target} study material into teaching notes for a tutor
+                             whose student is a native {native} speaker. Keep at most 15 vocabulary items,
+                             8 grammar points and 6 example sentences. Return valid JSON only.""",
+            user_payload={"source": packet.get("source"), "text": packet.get("text") or ""},
+            schema_name="notes",
+            schema=schema,
+            temperature=0,
+            stage="notes",
+        )
+        cache.parent.mkdir(parents=True, exist_ok=True)
+        tmp = cache.with_suffix(".tmp")
+        tmp.write_text(json.dumps(notes, ensure_ascii=False), encoding="utf-8")
+        os.replace(tmp, cache)
+        return notes
+
+    def condense_packets(self, packets: list[dict]) -> list[dict]:
+        # Map-reduce lesson generation. Map: every packet, in pieces of at most
+        # map_packet_max_chars, becomes teaching notes (cached by text hash).
+        # Reduce: while the notes exceed map_reduce_max_notes_chars,
+        # neighbouring notes are condensed together. A piece whose call fails
+        # goes in as its first map_fallback_chars of text.
+        prefs = self.settings.openai
+        parts = [
+            {**packet, "text": text}
+            for packet in packets
+            for text in (
+                [packet.get("text") or ""]
+                if packet.get("failed_card")
+                else split_text(packet.get("text") or "", max(1, prefs.map_packet_max_chars))
+            )
+        ]
+
+        def one(packet: dict) -> dict:
+            if packet.get("failed_card"):
+                return packet
+            try:
+                notes = self.condense_packet(packet)
+            except Exception:
+                return {**packet, "text": (packet.get("text") or "")[: prefs.map_fallback_chars]}
+            return {"source": packet.get("source"), "unit_index": packet.get("unit_index"), "notes": notes}
+
+        def merge(group: list[dict]) -> list[dict]:
+            if len(group) < 2:
+                return group
+            sources = list(dict.fromkeys(str(item.get("source")) for item in group))
+            text = json.dumps([item["notes"] for item in group], ensure_ascii=False)
+            try:
+                notes = self.condense_packet({"source": ", ".join(sources), "text": text})
+            except Exception:
+                return group
+            return [{"source": ", ".join(sources), "unit_index": None, "notes": notes}]
+
+        def size(items: list[dict]) -> int:
+            return sum(len(json.dumps(item, ensure_ascii=False)) for item in items)
+
+        with ThreadPoolExecutor(max_workers=max(1, prefs.map_workers)) as pool:
+            mapped = list(pool.map(one, parts))
+            while size(mapped) > prefs.map_reduce_max_notes_chars:
+                # Consecutive runs of notes, each small enough for one call;
+                # raw text and failed-card packets stay as they are.
+                groups: list[list[dict]] = []
+                for item in mapped:
+                    fits = (
+                        "notes" in item
+                        and groups
+                        and "notes" in groups[-1][-1]
+                        and size(groups[-1] + [item]) <= prefs.map_packet_max_chars
+                    )
+                    if fits:
+                        groups[-1].append(item)
+                    else:
+                        groups.append([item])
+                reduced = [item for group in pool.map(merge, groups) for item in group]
+                if len(reduced) >= len(mapped):
+                    break
+                mapped = reduced
+        return mapped
+
     def generate_cards(
     self,
     lesson_markdown: str,
     failed_cards: list[dict],
     target_cards: int,
+    ) -> list[dict]:
+        prefs = self.settings.openai
+        sections = split_lesson_sections(lesson_markdown, prefs.card_shard_min_words)
+        if not prefs.card_shards or len(sections) < 2 or target_cards < 2:
+            return self._generate_cards_once(lesson_markdown, failed_cards, target_cards)
+
+        if len(sections) > target_cards:
+            # More sections than cards: neighbouring sections share a shard,
+            # so every section still gets its share of the target.
+            k, n = target_cards, len(sections)
+            sections = ["\n\n".join(sections[i * n // k : (i + 1) * n // k]) for i in range(k)]
+        counts = allocate_cards([len(s.split()) for s in sections], target_cards)
+        # Failed cards are dealt round-robin so each is reinforced once, not once per shard.
+        shard_failures = [failed_cards[i::len(sections)] for i in range(len(sections))]
+        jobs = [i for i, n in enumerate(counts) if n > 0]
+        results: dict[int, list[dict]] = {}
+        attempts = 0
+        with ThreadPoolExecutor(max_workers=max(1, prefs.card_shard_workers)) as pool:
+            while jobs and attempts <= prefs.card_shard_retries:
+                futures = {
+                    i: pool.submit(self._generate_cards_once, sections[i], shard_failures[i], counts[i])
+                    for i in jobs
+                }
+                failed = []
+                for i, fut in futures.items():
+                    try:
+                        results[i] = fut.result()
+                    except Exception:
+                        failed.append(i)
+                jobs = failed
+                attempts += 1
+        if not results:
+            raise RuntimeError(f"Card generation failed for all {len(counts)} lesson shards")
+        cards = merge_cards([results[i] for i in sorted(results)], target_cards)
+        if len(cards) < target_cards:
+            # Shards overlapped (or one failed): one call over the whole lesson
+            # tops the deck up, told which fronts already exist.
+            try:
+                extra = self._generate_cards_once(
+                    lesson_markdown, [], target_cards - len(cards), existing_fronts=[c["front"] for c in cards]
+                )
+                cards = merge_cards([cards, extra], target_cards)
+            except Exception:
+                pass
+        return cards
+
+    def _generate_cards_once(
+        self,
+        lesson_markdown: str,
+        failed_cards: list[dict],
+        target_cards: int,
+        existing_fronts: list[str] | None = None,
     ) -> list[dict]:
         schema = {
             "type": "object",
@@ -275,6 +630,9 @@ class AIClient:
                 "Back must contain only the correct answer."
             ]       
         }
+        if existing_fronts:
+            payload["existing_card_fronts"] = existing_fronts
+            payload["card_design_rules"].append("Do not repeat or rephrase any card in existing_card_fronts.")
 
         data = self._json_response(
             system_prompt=f"""You are designing high-quality Anki cards for a {target} learner whose native language is {native}.
@@ -284,6 +642,7 @@ class AIClient:
             schema_name="cards",
             schema=schema,
             temperature=0,
+            stage="cards",
         )
 
         return data["cards"][:target_cards]
@@ -1,18 +1,21 @@
 from __future__ import annotations
 
 from datetime import datetime, timedelta
-import requests
 
 from .models import FailedCard
+from .transport import Transport, get_transport
+
+NOTE_CSS = ".card { font-family: arial; font-size: 20px; text-align: center; color: black; background-color: white; }"
 
 
 class AnkiConnectClient:
-    def __init__(self, base_url: str) -> None:
+    def __init__(self, base_url: str, transport: Transport | None = None) -> None:
         self.base_url = base_url
+        self.transport = transport or get_transport()
 
     def _invoke(self, action: str, **params):
         payload = {"action": action, "version": 6, "params": params}
-        resp = requests.post(self.base_url, json=payload, timeout=10)
+        resp = self.transport.post(self.base_url, json=payload, timeout=30 if action == "addNotes" else 10)
         resp.raise_for_status()
         data = resp.json()
         if data.get("error"):
@@ -72,3 +75,85 @@ class AnkiConnectClient:
                 break
 
         return out
+
+    def ensure_deck_and_note_type(self, deck: str, note_type: str) -> None:
+        # One round trip in the usual case; the note type is created only once.
+        results = self._invoke(
+            "multi",
+            actions=[
+                {"action": "createDeck", "version": 6, "params": {"deck": deck}},
+                {"action": "modelNames", "version": 6},
+            ],
+        ) or [{}, {}]
+        for r in results:
+            if r.get("error"):
+                raise RuntimeError(r["error"])
+        if note_type not in (results[1].get("result") or []):
+            self._invoke(
+                "createModel",
+                modelName=note_type,
+                inOrderFields=["Front", "Back"],
+                css=NOTE_CSS,
+                cardTemplates=[
+                    {"Name": "Card 1", "Front": "{{Front}}", "Back": "{{FrontSide}}<hr id=answer>{{Back}}"}
+                ],
+            )
+
+    def add_cards(
+        self,
+        deck: str,
+        note_type: str,
+        cards: list[dict[str, str]],
+        tags: list[str],
+        batch_size: int = 500,
+        on_batch=None,
+    ) -> dict:
+        # canAddNotesWithErrorDetail drops cards already in the deck, then
+        # addNotes sends the rest; both in batches of `batch_size` notes per
+        # request. Cards Anki rejects for any other reason are listed (by
+        # index) in "rejected". After each batch, on_batch gets the running
+        # (cards handled, added, duplicates, rejected).
+        notes = [
+            {
+                "deckName": deck,
+                "modelName": note_type,
+                "fields": {"Front": card["front"].strip(), "Back": card["back"].strip()},
+                "tags": tags,
+                "options": {
+                    "allowDuplicate": False,
+                    "duplicateScope": "deck",
+                    "duplicateScopeOptions": {"deckName": deck, "checkChildren": False},
+                },
+            }
+            for card in cards
+        ]
+        self.ensure_deck_and_note_type(deck, note_type)
+        added: list[int] = []
+        duplicates = 0
+        rejected: list[int] = []
+        step = max(1, batch_size)
+        for i in range(0, len(notes), step):
+            batch = notes[i : i + step]
+            checks = self._invoke("canAddNotesWithErrorDetail", notes=batch)
+            if not isinstance(checks, list) or len(checks) != len(batch):
+                raise RuntimeError("canAddNotesWithErrorDetail returned no usable result")
+            fresh: list[int] = []
+            for j, check in enumerate(checks, start=i):
+                if (check or {}).get("canAdd"):
+                    fresh.append(j)
+                elif "duplicate" in str((check or {}).get("error") or ""):
+                    duplicates += 1
+                else:
+                    rejected.append(j)
+            if fresh:
+                ids = self._invoke("addNotes", notes=[notes[j] for j in fresh])
+                if not isinstance(ids, list) or len(ids) != len(fresh):
+                    raise RuntimeError("addNotes returned no usable result")
+                for j, nid in zip(fresh, ids):
+                    if nid:
+                        added.append(nid)
+                    else:
+                        rejected.append(j)
+            if on_batch is not None:
+                on_batch(i + len(batch), len(added), duplicates, list(rejected))
+        return {"deck": deck, "added": len(added), "duplicates": duplicates, "rejected": rejected, "note_ids": added}
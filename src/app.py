@@ -1,25 +1,36 @@
 from __future__ import annotations
 
-from datetime import datetime
+from dataclasses import asdict
+from datetime import date, datetime
 from pathlib import Path
-import argparse
+import math
 
+# Modules imported here stay cheap at import time; heavy third-party libraries
+# (openai, fitz, pypdf, PIL, bs4, genanki, apscheduler) load on first use.
 from .ai_client import AIClient
 from .anki_integration import AnkiConnectClient
 from .config import load_settings
-from .emailer import send_email
+from .deadline import Deadline
+from .dedupe import canonical_url, content_hash, hamming, image_dhash, text_signature
 from .generator import build_anki_deck, save_lesson
 from .ingest import (
+    count_units_for_file,
     discover_files,
     fetch_url_text,
     file_fingerprint,
+    iter_all_units,
     load_links,
-    read_units_for_file,
+    read_units_at,
 )
-from .models import AppState, DailySelection, LessonBundle, SourceMeta
+from .journal import RunJournal
+from .models import AppState, DailySelection, LessonBundle, SourceMeta, SourceUnit
+from .ocr import OcrCache, ocr_images, ocr_pdf_pages
+from .pdf_text import PdfDocuments
 from .planner import fallback_selection
-from .scheduler import run_daily
-from .storage import load_state, save_state
+from .runlock import RunInProgress, RunLock
+from .storage import load_state, refresh_state, save_state
+from .transport import get_transport, metrics_delta
+from .triage import ROUTE_OCR, ROUTE_TEXT, ROUTE_VISION, triage_pdf_pages
 from .vision import VisionExtractor
 
 
@@ -46,17 +57,24 @@ def sync_sources(settings, state: AppState):
     for fp in files:
         sid = str(fp.resolve())
         seen.add(sid)
+        st = fp.stat()
+        meta = state.sources.get(sid)
+        if meta and meta.size == st.st_size and meta.mtime_ns == st.st_mtime_ns:
+            # Unchanged size and mtime: skip re-hashing the file.
+            continue
         fingerprint = file_fingerprint(fp)
-        if sid not in state.sources or state.sources[sid].fingerprint != fingerprint:
-            units = read_units_for_file(fp, settings.ingestion)
+        if meta is None or meta.fingerprint != fingerprint:
+            # Only the unit count is needed here; text is extracted when units are selected.
             state.sources[sid] = SourceMeta(
                 source_id=sid,
                 path=str(fp),
                 source_type=_source_type(fp),
                 fingerprint=fingerprint,
-                units=len(units),
+                units=count_units_for_file(fp, settings.ingestion, fingerprint, settings.cache_dir),
                 next_unit=0,
             )
+        state.sources[sid].size = st.st_size
+        state.sources[sid].mtime_ns = st.st_mtime_ns
 
     for sid in list(state.sources.keys()):
         if sid not in seen:
@@ -67,15 +85,140 @@ def sync_sources(settings, state: AppState):
         state.link_state.next_index = len(state.link_state.links)
 
 
-def choose_daily_selection(settings, state: AppState) -> DailySelection:
-    source_ids = sorted(state.sources.keys())
+def prepare_sources(settings, state: AppState) -> None:
+    # The deferred full-text pass, kept out of sync_sources: serve runs it in
+    # the background after each sync, and a run only catches up on sources
+    # the daemon has not signed yet. Copies are marked before anything is
+    # indexed, so each copy is read once, to sign it. Each PDF is opened for
+    # its own signing and closed after it, not held for the whole pass.
+    unsigned = [m for m in state.sources.values() if not m.signature] if settings.dedupe.enabled else []
+    for meta in unsigned:
+        try:
+            sign_source(settings, meta)
+        except Exception:
+            pass
+    mark_duplicates(settings, state)
+
+
+def sign_source(settings, meta: SourceMeta, docs: PdfDocuments | None = None) -> None:
+    # Images get a perceptual hash; everything else a SimHash of its full text.
+    if meta.source_type == "image":
+        meta.signature = image_dhash(Path(meta.path))
+        return
+    units = iter_all_units(Path(meta.path), settings.ingestion, meta.fingerprint, settings.cache_dir, docs=docs)
+    meta.signature, meta.words = text_signature(text for _, text in units)
+
+
+_CANONICAL_TYPES = {"text": 0, "docx": 1, "pdf": 2, "image": 3}
+
+
+def _same_content(prefs, a: SourceMeta, b: SourceMeta) -> bool:
+    if (a.source_type == "image") != (b.source_type == "image") or not a.signature or not b.signature:
+        return False
+    distance = hamming(int(a.signature, 16), int(b.signature, 16))
+    if a.source_type == "image":
+        return distance <= prefs.max_image_distance
+    if min(a.words, b.words) < prefs.min_words:
+        return distance == 0 and a.words == b.words
+    return distance <= prefs.max_text_distance and min(a.words, b.words) / max(a.words, b.words) >= prefs.min_length_ratio
+
+
+def mark_duplicates(settings, state: AppState) -> int:
+    # Each group of copies keeps one canonical source: the one already being
+    # read, else the current canonical, else the cheapest to extract (plain
+    # text, DOCX, PDF; the largest image). The others point at it and are
+    # never selected, OCR'd, described or indexed.
+    def rank(meta: SourceMeta):
+        size = -meta.size if meta.source_type == "image" else 0
+        return (meta.next_unit == 0, bool(meta.canonical_id), _CANONICAL_TYPES.get(meta.source_type, 9), size, meta.path)
+
+    canonicals: list[SourceMeta] = []
+    duplicates = 0
+    for meta in sorted(state.sources.values(), key=rank):
+        match = None
+        if settings.dedupe.enabled:
+            match = next((c for c in canonicals if _same_content(settings.dedupe, meta, c)), None)
+        if match is None:
+            meta.canonical_id = ""
+            canonicals.append(meta)
+        else:
+            meta.canonical_id = match.source_id
+            duplicates += 1
+    return duplicates
+
+
+def search_index_path(settings) -> Path:
+    return settings.cache_dir / "search.sqlite"
+
+
+def update_search_index(settings, state: AppState) -> None:
+    # Full text is extracted once per fingerprint, only for sources the index
+    # has not seen. Never part of a sync: serve's background syncs keep the
+    # index current, and a run catches up only when it needs failure context.
+    # Each PDF is opened while its units are indexed and closed after.
+    from .search_index import UnitIndex
+
+    with UnitIndex(search_index_path(settings)) as index:
+        index.retain({sid for sid, meta in state.sources.items() if not meta.canonical_id})
+        for sid, meta in state.sources.items():
+            if meta.canonical_id or index.is_current(sid, meta.fingerprint):
+                continue
+            if meta.source_type == "image" and not OcrCache(settings.cache_dir).get(meta.fingerprint):
+                continue
+            units = iter_all_units(Path(meta.path), settings.ingestion, meta.fingerprint, settings.cache_dir)
+            index.replace_source(sid, meta.fingerprint, meta.path, units)
+
+
+def failure_context_packets(
+    settings, state: AppState, failed_cards: list[dict], exclude: set[tuple[str, int]]
+) -> list[dict]:
+    from .search_index import UnitIndex
+
+    if not failed_cards:
+        return []
+    try:
+        update_search_index(settings, state)
+    except Exception:
+        pass
+    db = search_index_path(settings)
+    if not db.exists():
+        return []
+    out: list[dict] = []
+    used = 0
+    seen = set(exclude)
+    with UnitIndex(db) as index:
+        for card in failed_cards:
+            front = card.get("front", "")
+            taken = 0
+            for hit in index.search(f"{front} {card.get('back', '')}", limit=settings.search.passages_per_failure + 2):
+                key = (hit["path"], hit["unit_index"])
+                if key in seen or taken >= settings.search.passages_per_failure:
+                    continue
+                text = hit["text"][: settings.search.max_context_chars - used]
+                if not text:
+                    return out
+                seen.add(key)
+                used += len(text)
+                taken += 1
+                out.append({"source": hit["path"], "unit_index": hit["unit_index"], "text": text, "failed_card": front})
+    return out
+
+
+def choose_daily_selection(
+    settings, state: AppState, ai: AIClient | None = None, deadline: Deadline | None = None
+) -> DailySelection:
+    source_ids = sorted(sid for sid, meta in state.sources.items() if not meta.canonical_id)
     pdf_ids = [sid for sid in source_ids if state.sources[sid].source_type == "pdf"]
     links_remaining = len(state.link_state.links) - state.link_state.next_index
     sel = fallback_selection(settings, source_ids, pdf_ids, links_remaining)
 
-    if settings.openai_api_key and source_ids:
+    use_planner = bool(settings.openai_api_key and source_ids)
+    if use_planner and deadline and deadline.past(settings.deadline.skip_planner_after):
+        deadline.degrade("selection", "skip_planner", reason="behind schedule before planning")
+        use_planner = False
+    if use_planner:
         try:
-            ai = AIClient(settings)
+            ai = ai or AIClient(settings)
             stats = []
             for sid in source_ids:
                 meta = state.sources[sid]
@@ -148,48 +291,128 @@ def choose_daily_selection(settings, state: AppState) -> DailySelection:
     return sel
 
 
-def collect_packets(settings, state: AppState, sel: DailySelection) -> list[dict]:
+def collect_packets(
+    settings,
+    state: AppState,
+    sel: DailySelection,
+    docs: PdfDocuments | None = None,
+    failed_cards: list[dict] | None = None,
+    deadline: Deadline | None = None,
+) -> list[dict]:
+    if docs is None:
+        # Text extraction and vision rendering share one open handle per PDF for the run.
+        with PdfDocuments() as own:
+            return collect_packets(settings, state, sel, docs=own, failed_cards=failed_cards, deadline=deadline)
+
     packets: list[dict] = []
     vision = None
-    vision_pages_used = 0
-    vision_images_used = 0
     if settings.openai_api_key and (settings.openai.enable_pdf_vision or settings.openai.enable_image_vision):
         try:
-            vision = VisionExtractor(settings)
+            vision = VisionExtractor(settings, docs=docs, transport=get_transport(settings.http))
         except Exception:
             vision = None
 
+    # Decide up front which selected images vision will describe, then OCR the
+    # rest in parallel (results are cached by fingerprint).
+    image_ids = [
+        sid for sid, idxs in sel.source_units.items()
+        if state.sources[sid].source_type == "image" and 0 in idxs
+    ]
+    vision_image_ids = set()
+    if vision and settings.openai.enable_image_vision:
+        vision_image_ids = set(image_ids[: settings.openai.vision_max_images_per_day])
+    ocr_ids = [
+        sid for sid in image_ids
+        if not (settings.ingestion.ocr_skip_when_vision and sid in vision_image_ids)
+    ]
+    ocr_texts = ocr_images(
+        [(Path(state.sources[sid].path), state.sources[sid].fingerprint) for sid in ocr_ids],
+        settings.cache_dir,
+        settings.ingestion,
+    )
+
+    # PDF pages: either triage them locally (vision for visually rich pages,
+    # OCR for pages without a text layer, text for the rest) or spend the
+    # vision budget on the first selected pages in order.
+    pdf_pages = [
+        (sid, Path(state.sources[sid].path), idx)
+        for sid, idxs in sel.source_units.items()
+        if state.sources[sid].source_type == "pdf"
+        for idx in idxs
+    ]
+    vision_budget = settings.openai.vision_max_pages_per_day if vision and settings.openai.enable_pdf_vision else 0
+    if settings.openai.vision_triage:
+        page_routes = triage_pdf_pages(pdf_pages, docs, settings.openai, vision_budget)
+    else:
+        page_routes = {(sid, idx): ROUTE_TEXT for sid, _, idx in pdf_pages}
+        for sid, _, idx in pdf_pages[:vision_budget]:
+            page_routes[(sid, idx)] = ROUTE_VISION
+    page_ocr = ocr_pdf_pages(
+        [
+            (path, state.sources[sid].fingerprint, idx)
+            for sid, path, idx in pdf_pages
+            if page_routes.get((sid, idx)) == ROUTE_OCR
+        ],
+        settings.cache_dir,
+        settings.ingestion,
+    )
+
+    # Render everything vision should see and describe it in batched requests.
+    visuals: dict[str, str] = {}
+    if vision:
+        images = []
+        for sid, path, idx in pdf_pages:
+            if page_routes.get((sid, idx)) == ROUTE_VISION:
+                try:
+                    img = vision.pdf_page_image(f"{sid}#{idx}", path, idx)
+                except Exception:
+                    img = None
+                if img:
+                    images.append(img)
+        for sid in image_ids:
+            if sid in vision_image_ids:
+                try:
+                    images.append(vision.image_file_image(f"{sid}#0", Path(state.sources[sid].path)))
+                except Exception:
+                    pass
+        vision_late = None
+        if deadline:
+            vision_late = lambda: deadline.past(settings.deadline.skip_vision_after)
+        try:
+            visuals = vision.describe_images(images, stop=vision_late)
+        except Exception:
+            visuals = {}
+        skipped = [img.key for img in images if img.key not in visuals]
+        if deadline and skipped and vision_late():
+            deadline.degrade("packets", "skip_vision", reason="vision budget used up", skipped=skipped)
+
     for sid, unit_indexes in sel.source_units.items():
         meta = state.sources[sid]
-        units = read_units_for_file(Path(meta.path), settings.ingestion)
+        if meta.source_type == "image":
+            units = [SourceUnit(unit_index=0, text=ocr_texts.get(meta.fingerprint, ""))]
+        else:
+            units = read_units_at(
+                Path(meta.path), unit_indexes, settings.ingestion, meta.fingerprint, settings.cache_dir, docs=docs
+            )
+        units_by_index = {u.unit_index: u for u in units}
         for idx in unit_indexes:
-            if 0 <= idx < len(units):
-                text = units[idx].text
-                if (
-                    vision
-                    and meta.source_type == "pdf"
-                    and vision_pages_used < settings.openai.vision_max_pages_per_day
-                ):
-                    try:
-                        visual = vision.describe_pdf_page(Path(meta.path), idx)
-                    except Exception:
-                        visual = ""
+            if idx in units_by_index:
+                text = units_by_index[idx].text
+                route = page_routes.get((sid, idx)) if meta.source_type == "pdf" else None
+                if route == ROUTE_VISION:
+                    visual = visuals.get(f"{sid}#{idx}", "")
                     if visual:
                         text = (text or "").strip() + "\n\n[Visual Analysis]\n" + visual
-                    vision_pages_used += 1
-                elif (
-                    vision
-                    and meta.source_type == "image"
-                    and settings.openai.enable_image_vision
-                    and vision_images_used < settings.openai.vision_max_images_per_day
-                ):
-                    try:
-                        visual = vision.describe_image_file(Path(meta.path))
-                    except Exception:
-                        visual = ""
+                elif route == ROUTE_OCR:
+                    text = ((text or "").strip() + "\n" + page_ocr.get((meta.fingerprint, idx), "")).strip()
+                elif sid in vision_image_ids:
+                    visual = visuals.get(f"{sid}#0", "")
                     if visual:
                         text = (text or "").strip() + "\n\n[Visual Analysis]\n" + visual
-                    vision_images_used += 1
+                    elif meta.fingerprint not in ocr_texts:
+                        # Vision came back empty for an image we skipped OCR on.
+                        fallback = ocr_images([(Path(meta.path), meta.fingerprint)], settings.cache_dir, settings.ingestion)
+                        text = fallback.get(meta.fingerprint, "")
                 packets.append(
                     {
                         "source": meta.path,
@@ -198,20 +421,58 @@ def collect_packets(settings, state: AppState, sel: DailySelection) -> list[dict
                     }
                 )
 
+    dropped_links = []
+    seen_links = state.link_state.seen
     for link in sel.links:
+        timeout = 15
+        if deadline:
+            left = deadline.seconds_until(settings.deadline.drop_links_after)
+            if left <= 0:
+                dropped_links.append(link)
+                continue
+            if math.isfinite(left):
+                # A disabled deadline leaves the fetch timeout alone.
+                timeout = max(1, min(timeout, int(left)))
         try:
-            text = fetch_url_text(link)
+            text = fetch_url_text(link, timeout=timeout, transport=get_transport(settings.http))
         except Exception:
             text = ""
+        if text and settings.dedupe.enabled:
+            # A mirror of a page already read (under another URL) adds nothing.
+            key = canonical_url(link)
+            if seen_links.setdefault(content_hash(text), key) != key:
+                continue
         packets.append({"source": link, "unit_index": 0, "text": text})
+    if dropped_links:
+        deadline.degrade("packets", "drop_links", reason="link budget used up", dropped=dropped_links)
+
+    if settings.search.enabled and failed_cards:
+        # Passages from the library that explain recently failed cards.
+        try:
+            packets.extend(
+                failure_context_packets(
+                    settings, state, failed_cards, {(p["source"], p["unit_index"]) for p in packets}
+                )
+            )
+        except Exception:
+            pass
+
+    return cap_packets(packets, settings.openai.max_source_chars)
+
 
-    max_chars = settings.openai.max_source_chars
+def cap_packets(packets: list[dict], max_chars: int) -> list[dict]:
     joined = []
     used = 0
+    seen = set()
     for p in packets:
         t = (p.get("text") or "").strip()
         if not t:
             continue
+        # The same passage from two sources is sent once.
+        h = content_hash(t)
+        if h in seen:
+            continue
+        seen.add(h)
         budget = max_chars - used
         if budget <= 0:
             break
@@ -222,8 +483,32 @@ def collect_packets(settings, state: AppState, sel: DailySelection) -> list[dict
     return joined
 
 
+def push_cards(settings, cards: list[dict], day: date | None = None) -> dict:
+    # How far direct delivery got; the first "sent" cards need no .apkg,
+    # except the "rejected" ones (indexes into cards) Anki would not add.
+    day = day or date.today()
+    client = AnkiConnectClient(settings.ankiconnect_url, get_transport(settings.http))
+    progress = {"deck": settings.anki.deck_name, "sent": 0, "added": 0, "duplicates": 0, "rejected": []}
+
+    def on_batch(handled: int, added: int, duplicates: int, rejected: list[int]) -> None:
+        progress.update(sent=handled, added=added, duplicates=duplicates, rejected=rejected)
+
+    try:
+        client.add_cards(
+            settings.anki.deck_name,
+            settings.anki.note_type,
+            cards,
+            tags=["mentorloop", f"mentorloop::{day.isoformat()}"],
+            batch_size=settings.anki.batch_size,
+            on_batch=on_batch,
+        )
+    except Exception as e:
+        progress["error"] = f"{type(e).__name__}: {e}"
+    return progress
+
+
 def get_failed_cards(settings):
-    client = AnkiConnectClient(settings.ankiconnect_url)
+    client = AnkiConnectClient(settings.ankiconnect_url, get_transport(settings.http))
     try:
         cards = client.recent_failed_cards(
             settings.anki.failed_card_lookback_days,
@@ -234,9 +519,9 @@ def get_failed_cards(settings):
         return []
 
 
-def advance_state(state: AppState, sel: DailySelection) -> None:
+def advance_state(state: AppState, sel: DailySelection, command: str = "run-once", run_id: str = "") -> None:
     for sid, unit_indexes in sel.source_units.items():
-        if not unit_indexes:
+        if not unit_indexes or sid not in state.sources:
             continue
         meta = state.sources[sid]
         meta.next_unit = min(meta.units, max(unit_indexes) + 1)
@@ -245,6 +530,8 @@ def advance_state(state: AppState, sel: DailySelection) -> None:
     state.history.append(
         {
             "ts": datetime.now().isoformat(),
+            "command": command,
+            "run_id": run_id,
             "sources_used": {k: len(v) for k, v in sel.source_units.items()},
             "links_used": len(sel.links),
             "target_words": sel.target_lesson_words,
@@ -253,67 +540,479 @@ def advance_state(state: AppState, sel: DailySelection) -> None:
     )
 
 
-def run_once() -> None:
-    settings = load_settings()
-    state = load_state(settings.state_file)
+def run_lock_path(settings) -> Path:
+    return settings.state_file.parent / "run.lock"
 
-    sync_sources(settings, state)
-    sel = choose_daily_selection(settings, state)
-    packets = collect_packets(settings, state, sel)
-    failed_cards = get_failed_cards(settings)
 
-    if not packets:
-        raise RuntimeError("No usable content found for today's lesson")
+def acquire_run_lock(settings, command: str, wait: bool = True) -> tuple[RunLock, dict | None]:
+    # (lock, the owner record of the holder it had to wait for, if any)
+    lock = RunLock(run_lock_path(settings), command)
+    if lock.acquire(0):
+        return lock, None
+    waited_for = lock.holder() or {}
+    if not wait or settings.lock.wait_minutes <= 0 or not lock.acquire(settings.lock.wait_minutes * 60):
+        raise RunInProgress(lock.holder())
+    return lock, waited_for
 
-    ai = AIClient(settings)
-    lesson_markdown = ai.generate_lesson(
-    target_words=sel.target_lesson_words,
-    source_packets=packets,
-    failed_cards=failed_cards,
-    )
 
-    cards = ai.generate_cards(
-        lesson_markdown=lesson_markdown,
+def run_once(settings=None, fresh: bool = False, state: AppState | None = None, wait: bool = True) -> dict:
+    # Single flight across processes: a second caller waits for the run in
+    # progress and takes its result instead of paying for another one.
+    settings = settings or load_settings()
+    lock, waited_for = acquire_run_lock(settings, "run-once", wait)
+    try:
+        # Cursors may have moved in another process since `state` was loaded.
+        state = refresh_state(settings.state_file, state)
+        if waited_for and waited_for.get("command") == "run-once" and waited_for.get("run_id"):
+            # Only the run-once we waited for counts, and only if it finished.
+            for entry in reversed(state.history):
+                if entry.get("run_id") == waited_for["run_id"]:
+                    return {**entry, "attached": True}
+        return _run_once(settings, fresh, state, lock)
+    finally:
+        lock.release()
+
+
+def _run_once(settings, fresh: bool, state: AppState, lock: RunLock) -> dict:
+    from .emailer import send_email
+
+    # Every stage's output is checkpointed; a failed run resumes after its last
+    # completed stage on the next attempt the same day unless fresh=True.
+    journal = RunJournal.open(settings.state_file.parent / "runs", date.today())
+    if fresh:
+        journal.reset()
+
+    # One pooled transport per process and one AI client per run, shared by
+    # planning, vision, generation, AnkiConnect and link fetching.
+    transport = get_transport(settings.http)
+    http_before = transport.snapshot()
+    ai = AIClient(settings, transport) if settings.openai_api_key else None
+
+    # Delivery is due deadline.minutes after the scheduled time; stages that
+    # fall behind cut vision, links, lesson length and the planner, in that order.
+    deadline = Deadline.for_run(settings.deadline, settings.timezone, settings.schedule_hour, settings.schedule_minute)
+    earlier_degradations = journal.get("degradations") or []
+
+    def note_degradations() -> None:
+        if deadline.degradations:
+            journal.put("degradations", earlier_degradations + deadline.degradations)
+
+    sync_sources(settings, state)
+    prepare_sources(settings, state)
+    if journal.has("selection"):
+        sel = DailySelection(**journal.get("selection"))
+        sel.source_units = {sid: idxs for sid, idxs in sel.source_units.items() if sid in state.sources}
+    else:
+        sel = choose_daily_selection(settings, state, ai, deadline)
+        note_degradations()
+        journal.put("selection", asdict(sel))
+
+    if journal.has("failed_cards"):
+        failed_cards = journal.get("failed_cards")
+    else:
+        failed_cards = journal.put("failed_cards", get_failed_cards(settings))
+
+    if journal.has("packets"):
+        packets = journal.get("packets")
+    else:
+        packets = collect_packets(settings, state, sel, failed_cards=failed_cards, deadline=deadline)
+        if not packets:
+            raise RuntimeError("No usable content found for today's lesson")
+        note_degradations()
+        journal.put("packets", packets)
+
+    if journal.has("lesson"):
+        lesson_markdown = journal.get("lesson")
+    else:
+        ai = ai or AIClient(settings, transport)
+        target_words = sel.target_lesson_words
+        scale = deadline.lesson_scale()
+        if scale < 1:
+            target_words = max(1, int(target_words * scale))
+            deadline.degrade(
+                "lesson",
+                "shrink_lesson",
+                reason="behind schedule before the lesson",
+                target_words=sel.target_lesson_words,
+                shrunk_to=target_words,
+            )
+            note_degradations()
+        lesson_markdown = ai.generate_lesson(
+        target_words=target_words,
+        source_packets=packets,
         failed_cards=failed_cards,
-        target_cards=sel.target_cards,
-    )
+        )
+        journal.put("lesson", lesson_markdown)
+
+    if journal.has("cards"):
+        cards = journal.get("cards")
+    else:
+        ai = ai or AIClient(settings, transport)
+        cards = ai.generate_cards(
+            lesson_markdown=lesson_markdown,
+            failed_cards=failed_cards,
+            target_cards=sel.target_cards,
+        )
+        journal.put("cards", cards)
+
+    # Direct delivery adds the cards to Anki now; only what it could not send
+    # (Anki offline, a failure part-way, or notes Anki rejected) goes into the
+    # .apkg attachment.
+    cards = [c for c in cards if (c.get("front") or "").strip() and (c.get("back") or "").strip()]
+    anki = None
+    pending = cards
+    if settings.anki.delivery == "direct":
+        anki = journal.get("anki") or journal.put("anki", push_cards(settings, cards))
+        pending = [cards[i] for i in anki.get("rejected") or []] + cards[anki["sent"]:]
 
     bundle = LessonBundle(
         lesson_markdown=lesson_markdown,
-        cards=cards,
+        cards=pending,
     )
 
-    lesson_file = save_lesson(settings.output_dir, bundle.lesson_markdown)
-    deck_file = build_anki_deck(settings.output_dir, bundle)
+    files = journal.get("files") or {}
+    needed = ("lesson", "deck") if pending else ("lesson",)
+    if not all(Path(files.get(k) or "").is_file() for k in needed):
+        files = {"lesson": str(save_lesson(settings.output_dir, bundle.lesson_markdown))}
+        if pending and anki is not None:
+            # The fallback deck is the same named deck direct delivery uses.
+            deck_file = build_anki_deck(
+                settings.output_dir, bundle, deck_name=settings.anki.deck_name, model_name=settings.anki.note_type
+            )
+            files["deck"] = str(deck_file)
+        elif pending:
+            files["deck"] = str(build_anki_deck(settings.output_dir, bundle))
+        files = journal.put("files", files)
+    attachments = [Path(files[k]) for k in needed]
+
+    if not journal.has("sent"):
+        send_email(
+            settings,
+            subject=f"MentorLoop - {datetime.now().strftime('%Y-%m-%d')}",
+            body=bundle.lesson_markdown,
+            attachments=attachments,
+        )
+        journal.put("sent", datetime.now().isoformat())
+
+    advance_state(state, sel, "run-once", lock.run_id)
+    entry = state.history[-1]
+    entry["http"] = metrics_delta(http_before, transport.snapshot())
+    entry["degradations"] = earlier_degradations + deadline.degradations
+    if anki is not None:
+        entry["anki"] = anki
+    if lock.recovered:
+        entry["recovered_lock"] = lock.recovered
+    save_state(settings.state_file, state)
+    journal.complete()
+    return entry
+
+
+def plan_batch(settings, state: AppState, days: int, ai: AIClient | None = None) -> list[DailySelection]:
+    # Plan consecutive days against a scratch copy of the cursors; the real
+    # state only moves once the whole batch has been generated.
+    import copy
+
+    scratch = copy.deepcopy(state)
+    plans = []
+    for _ in range(days):
+        sel = choose_daily_selection(settings, scratch, ai)
+        if not sel.source_units and not sel.links:
+            break
+        plans.append(sel)
+        advance_state(scratch, sel)
+    return plans
+
+
+def split_batch_packets(plans: list[DailySelection], state: AppState, packets: list[dict]) -> list[list[dict]]:
+    owner: dict[tuple[str, int], int] = {}
+    for i, sel in enumerate(plans):
+        for sid, idxs in sel.source_units.items():
+            for idx in idxs:
+                owner[(state.sources[sid].path, idx)] = i
+        for link in sel.links:
+            owner.setdefault((link, 0), i)
+    per_day: list[list[dict]] = [[] for _ in plans]
+    for p in packets:
+        # Failure context explains cards failed before the batch, so it goes to the first day.
+        i = 0 if p.get("failed_card") else owner.get((p["source"], p["unit_index"]))
+        if i is not None:
+            per_day[i].append(p)
+    return per_day
+
+
+def run_batch(days: int, settings=None, wait: bool = True) -> None:
+    settings = settings or load_settings()
+    lock, _ = acquire_run_lock(settings, "batch", wait)
+    try:
+        _run_batch(days, settings, lock.run_id)
+    finally:
+        lock.release()
+
 
-    send_email(
+def _run_batch(days: int, settings, run_id: str = "") -> None:
+    from concurrent.futures import ThreadPoolExecutor
+    from dataclasses import replace
+    from datetime import timedelta
+
+    from .emailer import send_email
+
+    state = load_state(settings.state_file)
+    sync_sources(settings, state)
+    prepare_sources(settings, state)
+
+    transport = get_transport(settings.http)
+    ai = AIClient(settings, transport) if settings.openai_api_key else None
+    plans = plan_batch(settings, state, max(1, days), ai)
+    if not plans:
+        raise RuntimeError("No unread content left to plan a batch")
+    start = date.today()
+    failed_cards = get_failed_cards(settings)
+
+    # One extraction pass for the whole batch: every source is opened once and
+    # its units for all days are read together. Per-day budgets scale with N
+    # and are re-applied per day after the split.
+    n = len(plans)
+    combined = DailySelection(
+        source_units={},
+        links=[link for sel in plans for link in sel.links],
+        target_lesson_words=0,
+        target_cards=0,
+    )
+    for sel in plans:
+        for sid, idxs in sel.source_units.items():
+            combined.source_units.setdefault(sid, []).extend(idxs)
+    batch_settings = replace(
         settings,
-        subject=f"MentorLoop - {datetime.now().strftime('%Y-%m-%d')}",
-        body=bundle.lesson_markdown,
-        attachments=[lesson_file, deck_file],
+        openai=replace(
+            settings.openai,
+            max_source_chars=settings.openai.max_source_chars * n,
+            vision_max_pages_per_day=settings.openai.vision_max_pages_per_day * n,
+            vision_max_images_per_day=settings.openai.vision_max_images_per_day * n,
+        ),
     )
+    packets = collect_packets(batch_settings, state, combined, failed_cards=failed_cards)
+    day_packets = [
+        cap_packets(p, settings.openai.max_source_chars)
+        for p in split_batch_packets(plans, state, packets)
+    ]
+
+    ai = ai or AIClient(settings, transport)
+
+    def generate(i: int) -> tuple[Path, Path]:
+        if not day_packets[i]:
+            raise RuntimeError(f"No usable content found for day {i + 1}")
+        day_failed = failed_cards if i == 0 else []
+        lesson_markdown = ai.generate_lesson(
+            target_words=plans[i].target_lesson_words,
+            source_packets=day_packets[i],
+            failed_cards=day_failed,
+        )
+        cards = ai.generate_cards(
+            lesson_markdown=lesson_markdown,
+            failed_cards=day_failed,
+            target_cards=plans[i].target_cards,
+        )
+        bundle = LessonBundle(lesson_markdown=lesson_markdown, cards=cards)
+        day = start + timedelta(days=i)
+        return save_lesson(settings.output_dir, bundle.lesson_markdown, day), build_anki_deck(
+            settings.output_dir, bundle, day
+        )
 
-    advance_state(state, sel)
+    results: list[tuple[Path, Path] | None] = [None] * n
+    errors: list[str] = []
+    with ThreadPoolExecutor(max_workers=max(1, settings.openai.batch_workers)) as pool:
+        futures = [pool.submit(generate, i) for i in range(n)]
+        for i, fut in enumerate(futures):
+            try:
+                results[i] = fut.result()
+            except Exception as exc:
+                errors.append(f"{start + timedelta(days=i)}: {exc}")
+
+    # Cursors only move past the leading run of days that were generated, so a
+    # failed day and everything after it is planned again next time.
+    done = 0
+    while done < n and results[done] is not None:
+        done += 1
+    files = [f for pair in results[:done] for f in pair]
+    if files:
+        end = start + timedelta(days=done - 1)
+        send_email(
+            settings,
+            subject=f"MentorLoop - {start.isoformat()} to {end.isoformat()}",
+            body="\n".join(f"{f.name}" for f in files),
+            attachments=files,
+        )
+        for sel in plans[:done]:
+            advance_state(state, sel, "batch", run_id)
     save_state(settings.state_file, state)
+    for f in files:
+        print(f)
+    if errors:
+        raise RuntimeError("Batch incomplete: " + "; ".join(errors))
+
+
+def background_sync(settings, state: AppState | None = None) -> None:
+    lock = RunLock(run_lock_path(settings), "sync")
+    if not lock.acquire(0):
+        # A run holds the lock and syncs content itself.
+        return
+    try:
+        state = refresh_state(settings.state_file, state)
+        sync_sources(settings, state)
+        save_state(settings.state_file, state)
+        prepare_sources(settings, state)
+        save_state(settings.state_file, state)
+        if settings.search.enabled:
+            try:
+                update_search_index(settings, state)
+            except Exception:
+                pass
+    finally:
+        lock.release()
+
+
+def _state_summary(state: AppState) -> dict:
+    return {
+        "sources": len(state.sources),
+        "duplicates": sum(1 for m in state.sources.values() if m.canonical_id),
+        "units_remaining": sum(
+            max(0, m.units - m.next_unit) for m in state.sources.values() if not m.canonical_id
+        ),
+        "links_remaining": max(0, len(state.link_state.links) - state.link_state.next_index),
+        "last_history": state.history[-1] if state.history else None,
+    }
 
 
 def serve() -> None:
+    import signal
+    import threading
+
+    from .daemon import Daemon, start_http, stop_http
+    from .ledger import get_ledger
+    from .scheduler import run_daily
+
+    # Warm daemon: settings, state, HTTP clients, the ledger and caches stay
+    # resident; scheduled runs, ad hoc runs (run-once forwards here) and the
+    # watcher's syncs are serialised on the daemon's lock.
+    settings = load_settings()
+    state = load_state(settings.state_file)
+
+    def run(fresh: bool) -> dict:
+        return run_once(settings, fresh=fresh, state=state)
+
+    def metrics() -> dict:
+        tokens, usd = get_ledger(settings).spent("day", date.today().isoformat())
+        return {
+            "http": get_transport(settings.http).snapshot(),
+            "ledger_today": {"tokens": tokens, "cost_usd": round(usd, 4)},
+        }
+
+    daemon = Daemon(run, lambda: background_sync(settings, state))
+    server = None
+    if settings.daemon.enabled:
+        server = start_http(daemon, settings, lambda: _state_summary(state), metrics)
+
+    def terminate(*_) -> None:
+        raise SystemExit(0)
+
+    # SIGTERM (systemd, docker stop) unwinds like Ctrl-C so the port file is removed.
+    signal.signal(signal.SIGTERM, terminate)
+
+    watcher = None
+    if settings.watch.enabled:
+        from .watcher import ContentWatcher
+
+        def on_change() -> None:
+            daemon.sync()
+
+        watcher = ContentWatcher(
+            settings.content_dir,
+            on_change,
+            debounce_s=settings.watch.debounce_seconds,
+            poll_s=settings.watch.poll_seconds,
+        )
+        watcher.start()
+        # Index whatever changed while the service was down.
+        threading.Thread(target=on_change, daemon=True).start()
+    try:
+        run_daily(
+            settings.timezone,
+            settings.schedule_hour,
+            settings.schedule_minute,
+            lambda: daemon.trigger(source="schedule"),
+        )
+    finally:
+        if watcher is not None:
+            watcher.stop()
+        if server is not None:
+            stop_http(server, settings)
+
+
+def search(query: str, limit: int) -> None:
+    from .search_index import UnitIndex
+
     settings = load_settings()
-    run_daily(settings.timezone, settings.schedule_hour, settings.schedule_minute, run_once)
+    # Catch up on sources synced since the index was last updated.
+    update_search_index(settings, load_state(settings.state_file))
+    db = search_index_path(settings)
+    if not db.exists():
+        print("no search index yet (run `run-once` to index content/)")
+        return
+    with UnitIndex(db) as index:
+        for hit in index.search(query, limit=limit):
+            print(f"{hit['score']:>8.3f}  {hit['path']}#{hit['unit_index']}")
+            print(f"          {hit['text']}")
 
 
-def main() -> None:
-    parser = argparse.ArgumentParser(description="MentorLoop")
-    sub = parser.add_subparsers(dest="cmd", required=True)
-    sub.add_parser("run-once")
-    sub.add_parser("serve")
-    args = parser.parse_args()
+def report(days: int, group_by: str) -> None:
+    from datetime import timedelta
 
-    if args.cmd == "run-once":
-        run_once()
-    elif args.cmd == "serve":
-        serve()
+    from .ledger import TokenLedger, ledger_path
 
+    settings = load_settings()
+    if not ledger_path(settings).exists():
+        print("no model calls recorded yet")
+        return
+    ledger = TokenLedger(ledger_path(settings), settings.budget)
+    since = (date.today() - timedelta(days=max(0, days - 1))).isoformat()
+    rows = ledger.report(since, group_by)
+    keys = [k for k in ("day", "month", "stage", "model") if rows and k in rows[0]]
+    header = keys + ["calls", "input", "cached", "output", "cost_usd", "avg_ms", "failed"]
+    print("  ".join(f"{h:>12}" for h in header))
+    for r in rows:
+        cells = [r[k] for k in keys] + [
+            r["calls"], r["input_tokens"], r["cached_tokens"], r["output_tokens"],
+            f"{r['cost_usd']:.4f}", r["avg_latency_ms"], r["failed"],
+        ]
+        print("  ".join(f"{str(c):>12}" for c in cells))
+    today_tokens, today_usd = ledger.spent("day", date.today().isoformat())
+    month_tokens, month_usd = ledger.spent("month", date.today().strftime("%Y-%m"))
+    b = settings.budget
+    print(f"today: {today_tokens} tokens, ${today_usd:.4f} (budget: {b.daily_tokens or '-'} tokens, ${b.daily_usd or '-'})")
+    print(f"month: {month_tokens} tokens, ${month_usd:.4f} (budget: {b.monthly_tokens or '-'} tokens, ${b.monthly_usd or '-'})")
+    ledger.close()
+
+
+def forward_to_daemon(fresh: bool, wait: bool = True) -> bool:
+    from .daemon import forward_run, forward_timeout
 
-if __name__ == "__main__":
-    main()
+    settings = load_settings()
+    try:
+        result = forward_run(settings, fresh, wait)
+    except TimeoutError:
+        raise SystemExit(
+            f"serve daemon: no answer within {forward_timeout(settings):.0f}s; the run may still finish there"
+        ) from None
+    if result is None:
+        return False
+    if not wait:
+        # The daemon did not block: either it started a run or one is in progress.
+        if result.get("attached"):
+            raise RunInProgress({"pid": "serve", "command": f"run {result.get('run')}", **result})
+        print(f"serve daemon: run {result.get('run')} started")
+        return True
+    how = "attached to the run in progress" if result.get("attached") else f"run {result.get('run')}"
+    if result.get("ok"):
+        print(f"serve daemon: {how} finished in {result.get('duration_s')}s")
+        return True
+    raise SystemExit(f"serve daemon: {how} failed: {result.get('error')}")
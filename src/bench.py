@@ -0,0 +1,796 @@
+from __future__ import annotations
+
+from dataclasses import dataclass, replace
+from datetime import datetime
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+import difflib
+import json
+import platform
+import random
+import shutil
+import socketserver
+import statistics
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import zipfile
+import zlib
+
+from .config import load_settings
+from .storage import load_state
+from .transport import get_transport, metrics_delta
+
+
+@dataclass
+class BenchParams:
+    sizes: list[int]
+    repeat: int = 1
+    pdf_pages: int = 120
+    text_words: int = 60000
+    docx_paragraphs: int = 1500
+    links: int = 5
+    openai_latency_ms: int = 0
+    anki_latency_ms: int = 0
+    web_latency_ms: int = 0
+    smtp_latency_ms: int = 0
+    seed: int = 42
+
+
+SYLLABLES = ["ber", "ge", "lich", "keit", "haus", "un", "ver", "sch", "en", "ung", "tag", "stein", "wald", "zeit", "an"]
+
+
+def _words(rng: random.Random, n: int) -> list[str]:
+    return ["".join(rng.choice(SYLLABLES) for _ in range(rng.randint(1, 4))) for _ in range(n)]
+
+
+def _paragraphs(rng: random.Random, n: int, words_per: int = 60) -> list[str]:
+    return [" ".join(_words(rng, words_per)).capitalize() + "." for _ in range(n)]
+
+
+def _write_pdf(path: Path, rng: random.Random, pages: int) -> None:
+    import fitz
+
+    doc = fitz.open()
+    for i in range(pages):
+        page = doc.new_page()
+        page.insert_text((72, 40), "Deutsch Kompakt - Kapitel %d" % (i // 10 + 1), fontsize=9)
+        body = "\n".join(_paragraphs(rng, 6, 45))
+        page.insert_textbox(fitz.Rect(72, 60, 540, 700), body, fontsize=9)
+        if i % 4 == 0:
+            # Every fourth page carries a simple "diagram" so vision has something to look at.
+            page.draw_rect(fitz.Rect(100, 600, 300, 760), color=(0, 0, 1), fill=(0.8, 0.8, 1))
+            page.draw_line((100, 600), (300, 760), color=(1, 0, 0))
+        page.insert_text((72, 785), "© 2024 Lernverlag GmbH - Alle Rechte vorbehalten", fontsize=7)
+        page.insert_text((300, 800), str(i + 1), fontsize=9)
+    doc.save(str(path))
+    doc.close()
+
+
+def _docx_xml(paragraphs: list[str], rows: list[tuple[str, str]]) -> str:
+    ns = 'xmlns:w="http://schemas.openxmlformats.org/wordprocessingml/2006/main"'
+    parts = [f"<w:p><w:r><w:t>{p}</w:t></w:r></w:p>" for p in paragraphs]
+    cells = "".join(
+        f"<w:tr><w:tc><w:p><w:r><w:t>{a}</w:t></w:r></w:p></w:tc>"
+        f"<w:tc><w:p><w:r><w:t>{b}</w:t></w:r></w:p></w:tc></w:tr>"
+        for a, b in rows
+    )
+    parts.append(f"<w:tbl>{cells}</w:tbl>")
+    return f'<?xml version="1.0" encoding="UTF-8" standalone="yes"?><w:document {ns}><w:body>{"".join(parts)}</w:body></w:document>'
+
+
+def _write_docx(path: Path, rng: random.Random, paragraphs: int) -> None:
+    content_types = (
+        '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+        '<Types xmlns="http://schemas.openxmlformats.org/package/2006/content-types">'
+        '<Default Extension="rels" ContentType="application/vnd.openxmlformats-package.relationships+xml"/>'
+        '<Default Extension="xml" ContentType="application/xml"/>'
+        '<Override PartName="/word/document.xml" '
+        'ContentType="application/vnd.openxmlformats-officedocument.wordprocessingml.document.main+xml"/>'
+        "</Types>"
+    )
+    rels = (
+        '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+        '<Relationships xmlns="http://schemas.openxmlformats.org/package/2006/relationships">'
+        '<Relationship Id="rId1" '
+        'Type="http://schemas.openxmlformats.org/officeDocument/2006/relationships/officeDocument" '
+        'Target="word/document.xml"/></Relationships>'
+    )
+    vocab = [(w, w[::-1]) for w in _words(rng, max(10, paragraphs // 10))]
+    with zipfile.ZipFile(path, "w", zipfile.ZIP_DEFLATED) as z:
+        z.writestr("[Content_Types].xml", content_types)
+        z.writestr("_rels/.rels", rels)
+        z.writestr("word/document.xml", _docx_xml(_paragraphs(rng, paragraphs), vocab))
+
+
+def _write_image(path: Path, rng: random.Random) -> None:
+    from PIL import Image, ImageDraw
+
+    img = Image.new("RGB", (1600, 1200), "white")
+    draw = ImageDraw.Draw(img)
+    for row in range(20):
+        draw.text((60, 40 + row * 55), " ".join(_words(rng, 8)), fill="black")
+    draw.rectangle((1100, 700, 1500, 1100), outline="blue", width=4)
+    img.save(path)
+
+
+def build_corpus(root: Path, size: int, params: BenchParams, links_base: str, with_images: bool = True) -> dict:
+    rng = random.Random(params.seed + size)
+    root.mkdir(parents=True, exist_ok=True)
+    for i in range(size):
+        _write_pdf(root / f"book-{i:03d}.pdf", rng, params.pdf_pages)
+        _write_docx(root / f"export-{i:03d}.docx", rng, params.docx_paragraphs)
+        (root / f"notes-{i:03d}.txt").write_text(
+            "\n\n".join(_paragraphs(rng, max(1, params.text_words // 60))), encoding="utf-8"
+        )
+        (root / f"chapter-{i:03d}.md").write_text(
+            "# Kapitel\n\n" + "\n\n".join(_paragraphs(rng, max(1, params.text_words // 120))),
+            encoding="utf-8",
+        )
+        if with_images:
+            _write_image(root / f"scan-{i:03d}.png", rng)
+            _write_image(root / f"photo-{i:03d}.jpg", rng)
+    links = [f"{links_base}/page/{n}" for n in range(params.links * size)]
+    (root / "links.txt").write_text("\n".join(links) + "\n", encoding="utf-8")
+
+    files = [p for p in root.rglob("*") if p.is_file()]
+    return {"files": len(files), "bytes": sum(p.stat().st_size for p in files)}
+
+
+def _usage(prompt: str, completion: str) -> dict:
+    i, o = max(1, len(prompt) // 4), max(1, len(completion) // 4)
+    return {
+        "input_tokens": i,
+        "output_tokens": o,
+        "total_tokens": i + o,
+        "input_tokens_details": {"cached_tokens": 0},
+        "output_tokens_details": {"reasoning_tokens": 0},
+    }
+
+
+def _stub_plan(payload: dict) -> dict:
+    stats = payload.get("source_stats", [])
+    prefs = payload.get("preferences", {})
+    return {
+        "target_lesson_words": prefs.get("target_lesson_words", 1000),
+        "target_cards": prefs.get("cards_per_day", 20),
+        "per_source_units": [
+            {"source_id": s["source_id"], "units": 1} for s in stats if s.get("remaining_units")
+        ][: prefs.get("max_total_units_per_day", 5)],
+        "links_to_use": prefs.get("default_links_per_day", 5),
+    }
+
+
+def _stub_cards(payload: dict) -> dict:
+    n = int(payload.get("target_cards", 20))
+    tag = zlib.crc32(str(payload.get("lesson", "")).encode("utf-8"))
+    return {"cards": [{"front": f"Wort {tag}-{i}", "back": f"word {i}"} for i in range(n)]}
+
+
+def _stub_lesson(payload: dict) -> str:
+    words = int((payload.get("constraints") or {}).get("target_words", 1000))
+    body = " ".join(["lorem"] * max(1, words // 4))
+    return "\n\n".join(f"## Abschnitt {i}\n\n{body}" for i in range(4))
+
+
+class _StubHandler(BaseHTTPRequestHandler):
+    server: "StubServer"
+    # Keep-alive, like the real endpoints, so connection reuse shows up in the numbers.
+    protocol_version = "HTTP/1.1"
+    # Headers and body go out in separate writes; without TCP_NODELAY each
+    # small response waits ~40 ms on the client's delayed ACK.
+    disable_nagle_algorithm = True
+
+    def log_message(self, format, *args):
+        pass
+
+    def _send_json(self, obj: dict) -> None:
+        data = json.dumps(obj).encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def _send_sse(self, response: dict) -> None:
+        text = response["output"][0]["content"][0]["text"]
+        events = [{"type": "response.created", "response": {**response, "status": "in_progress", "output": []}}]
+        for i in range(0, len(text), 2000):
+            events.append(
+                {
+                    "type": "response.output_text.delta",
+                    "item_id": "msg_bench",
+                    "output_index": 0,
+                    "content_index": 0,
+                    "delta": text[i:i + 2000],
+                    "logprobs": [],
+                }
+            )
+        events.append({"type": "response.completed", "response": response})
+        self.send_response(200)
+        self.send_header("Content-Type", "text/event-stream")
+        self.send_header("Transfer-Encoding", "chunked")
+        self.end_headers()
+        # Like the real API: headers right away, the first token after the latency.
+        time.sleep(self.server.latency["openai"])
+        try:
+            for n, event in enumerate(events):
+                data = f"event: {event['type']}\ndata: {json.dumps({**event, 'sequence_number': n})}\n\n".encode()
+                self.wfile.write(f"{len(data):x}\r\n".encode() + data + b"\r\n")
+                self.wfile.flush()
+            self.wfile.write(b"0\r\n\r\n")
+        except (BrokenPipeError, ConnectionResetError):
+            self.close_connection = True
+
+    def _body(self) -> dict:
+        length = int(self.headers.get("Content-Length") or 0)
+        raw = self.rfile.read(length) if length else b"{}"
+        return json.loads(raw or b"{}")
+
+    def do_GET(self):
+        if not self.path.startswith("/page/"):
+            self.send_error(404)
+            return
+        time.sleep(self.server.latency["web"])
+        n = self.path.rsplit("/", 1)[-1]
+        rng = random.Random(n)
+        html = (
+            f"<html><head><title>Seite {n}</title><script>var x = 1;</script></head><body>"
+            + "".join(f"<p>{p}</p>" for p in _paragraphs(rng, 30))
+            + "</body></html>"
+        ).encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", "text/html; charset=utf-8")
+        self.send_header("Content-Length", str(len(html)))
+        self.end_headers()
+        self.wfile.write(html)
+
+    def do_POST(self):
+        req = self._body()
+        if self.path.startswith("/v1/responses"):
+            self.server.count("responses")
+            if req.get("stream"):
+                self._send_sse(self._responses(req))
+            else:
+                time.sleep(self.server.latency["openai"])
+                self._send_json(self._responses(req))
+        elif self.path.startswith("/v1/chat/completions"):
+            time.sleep(self.server.latency["openai"])
+            self.server.count("chat")
+            text = "Diagram: a blue box linked to a red arrow. Table: none."
+            if (req.get("response_format") or {}).get("type") == "json_object":
+                parts = req["messages"][-1]["content"]
+                keys = [p["text"][5:] for p in parts if p.get("type") == "text" and p["text"].startswith("key: ")]
+                text = json.dumps({"pages": [{"key": k, "analysis": text} for k in keys]})
+            self._send_json(
+                {
+                    "id": "chatcmpl-bench",
+                    "object": "chat.completion",
+                    "created": int(time.time()),
+                    "model": req.get("model", "bench"),
+                    "choices": [
+                        {
+                            "index": 0,
+                            "finish_reason": "stop",
+                            "message": {"role": "assistant", "content": text},
+                        }
+                    ],
+                    "usage": {"prompt_tokens": 800, "completion_tokens": 20, "total_tokens": 820},
+                }
+            )
+        elif self.path.startswith("/anki"):
+            time.sleep(self.server.latency["anki"])
+            self.server.count("anki")
+            self._send_json({"result": self._anki(req), "error": None})
+        else:
+            self.send_error(404)
+
+    def _responses(self, req: dict) -> dict:
+        messages = req.get("input") or []
+        prompt = messages[-1]["content"] if messages else "{}"
+        payload = json.loads(prompt) if prompt.strip().startswith("{") else {}
+        fmt = ((req.get("text") or {}).get("format") or {}).get("name")
+        if fmt == "plan":
+            text = json.dumps(_stub_plan(payload))
+        elif fmt == "cards":
+            text = json.dumps(_stub_cards(payload))
+        elif fmt == "notes":
+            words = str(payload.get("text", "")).split()
+            text = json.dumps(
+                {
+                    "summary": " ".join(words[:40]),
+                    "key_vocabulary": [{"term": w, "meaning": w[::-1]} for w in words[:15]],
+                    "grammar_points": ["Verbzweitstellung"],
+                    "example_sentences": [" ".join(words[:8])],
+                }
+            )
+        else:
+            text = _stub_lesson(payload)
+        return {
+            "id": "resp_bench",
+            "object": "response",
+            "created_at": int(time.time()),
+            "model": req.get("model", "bench"),
+            "status": "completed",
+            "parallel_tool_calls": False,
+            "tool_choice": "auto",
+            "tools": [],
+            "output": [
+                {
+                    "type": "message",
+                    "id": "msg_bench",
+                    "role": "assistant",
+                    "status": "completed",
+                    "content": [{"type": "output_text", "text": text, "annotations": []}],
+                }
+            ],
+            "usage": _usage(prompt, text),
+        }
+
+    def _anki(self, req: dict):
+        action = req.get("action")
+        params = req.get("params") or {}
+        anki = self.server.anki
+        if action == "multi":
+            out = []
+            for sub in params.get("actions", []):
+                try:
+                    out.append({"result": self._anki(sub), "error": None})
+                except Exception as e:
+                    out.append({"result": None, "error": str(e)})
+            return out
+        if action == "createDeck":
+            return anki["decks"].setdefault(params["deck"], len(anki["decks"]) + 1)
+        if action == "modelNames":
+            return sorted(anki["models"])
+        if action == "createModel":
+            anki["models"].add(params["modelName"])
+            return {"name": params["modelName"]}
+        if action in ("canAddNotesWithErrorDetail", "addNotes"):
+            out = []
+            with self.server._lock:
+                for note in params.get("notes", []):
+                    key = (note["deckName"], next(iter(note["fields"].values()), ""))
+                    error = None
+                    if note["modelName"] not in anki["models"]:
+                        error = "model was not found"
+                    elif key in anki["notes"]:
+                        error = "cannot create note because it is a duplicate"
+                    if action == "addNotes":
+                        if error is None:
+                            anki["notes"][key] = len(anki["notes"]) + 1
+                        out.append(None if error else anki["notes"][key])
+                    else:
+                        out.append({"canAdd": True} if error is None else {"canAdd": False, "error": error})
+            return out
+        if action == "findCards":
+            return list(range(1, 31))
+        if action == "cardsInfo":
+            return [
+                {
+                    "cardId": cid,
+                    "interval": 1,
+                    "fields": {"Front": {"value": f"Fehler {cid}"}, "Back": {"value": f"mistake {cid}"}},
+                }
+                for cid in params.get("cards", [])
+            ]
+        if action == "getReviewsOfCards":
+            now_ms = int(time.time() * 1000)
+            return {str(cid): [{"id": now_ms, "ease": 1}] for cid in params.get("cards", [])}
+        return None
+
+
+class StubServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self, latency: dict[str, float]) -> None:
+        super().__init__(("127.0.0.1", 0), _StubHandler)
+        self.latency = latency
+        self.calls: dict[str, int] = {}
+        # AnkiConnect's collection: decks, note types and notes keyed by (deck, first field).
+        self.anki: dict = {"decks": {}, "models": set(), "notes": {}}
+        self._lock = threading.Lock()
+
+    def count(self, kind: str) -> None:
+        with self._lock:
+            self.calls[kind] = self.calls.get(kind, 0) + 1
+
+    def handle_error(self, request, client_address) -> None:
+        # Hedged calls close the losing stream mid-response; that is expected.
+        if not isinstance(sys.exc_info()[1], ConnectionError):
+            super().handle_error(request, client_address)
+
+    @property
+    def base_url(self) -> str:
+        return f"http://127.0.0.1:{self.server_address[1]}"
+
+
+class _SmtpHandler(socketserver.StreamRequestHandler):
+    def _reply(self, line: str) -> None:
+        self.wfile.write((line + "\r\n").encode("ascii"))
+
+    def handle(self):
+        self._reply("220 bench ESMTP")
+        while True:
+            line = self.rfile.readline()
+            if not line:
+                return
+            cmd = line.decode("ascii", "ignore").strip().upper()
+            if cmd.startswith(("EHLO", "HELO")):
+                self._reply("250-bench")
+                self._reply("250 AUTH PLAIN")
+            elif cmd.startswith("AUTH"):
+                self._reply("235 ok")
+            elif cmd.startswith(("MAIL", "RCPT", "RSET", "NOOP")):
+                self._reply("250 ok")
+            elif cmd == "DATA":
+                self._reply("354 go ahead")
+                size = 0
+                while True:
+                    chunk = self.rfile.readline()
+                    if not chunk or chunk in (b".\r\n", b".\n"):
+                        break
+                    size += len(chunk)
+                time.sleep(self.server.latency)
+                self.server.messages.append(size)
+                self._reply("250 queued")
+            elif cmd == "QUIT":
+                self._reply("221 bye")
+                return
+            else:
+                self._reply("502 not implemented")
+
+
+class SmtpStub(socketserver.ThreadingTCPServer):
+    daemon_threads = True
+    allow_reuse_address = True
+
+    def __init__(self, latency: float) -> None:
+        super().__init__(("127.0.0.1", 0), _SmtpHandler)
+        self.latency = latency
+        self.messages: list[int] = []
+
+
+def _serve(server) -> threading.Thread:
+    t = threading.Thread(target=server.serve_forever, daemon=True)
+    t.start()
+    return t
+
+
+def _timed(fn, repeat: int) -> dict:
+    samples = []
+    for _ in range(max(1, repeat)):
+        t0 = time.perf_counter()
+        fn()
+        samples.append(time.perf_counter() - t0)
+    return {
+        "median_s": round(statistics.median(samples), 6),
+        "min_s": round(min(samples), 6),
+        "samples_s": [round(s, 6) for s in samples],
+    }
+
+
+def compare_pdf_backends(pdfs: list[Path]) -> dict:
+    from .pdf_text import PDF_BACKENDS, PdfDocuments
+
+    texts: dict[str, dict[tuple[str, int], str]] = {}
+    report: dict[str, dict] = {}
+    for name, backend_cls in PDF_BACKENDS.items():
+        with PdfDocuments() as docs:
+            backend = backend_cls(docs)
+            t0 = time.perf_counter()
+            pages = {}
+            for pdf in pdfs:
+                for i, text in backend.extract_pages(pdf, list(range(backend.page_count(pdf)))).items():
+                    pages[(str(pdf), i)] = text
+            elapsed = time.perf_counter() - t0
+        texts[name] = pages
+        report[name] = {
+            "pages": len(pages),
+            "seconds": round(elapsed, 4),
+            "pages_per_sec": round(len(pages) / elapsed, 1) if elapsed else None,
+            "chars": sum(len(t) for t in pages.values()),
+        }
+
+    # Parity: word-sequence similarity of each page against the pypdf output.
+    ratios = []
+    base = texts.get("pypdf", {})
+    for name, pages in texts.items():
+        if name == "pypdf":
+            continue
+        ratios = [
+            difflib.SequenceMatcher(None, base[k].split(), pages.get(k, "").split(), autojunk=False).ratio()
+            for k in base
+        ]
+        report[name]["parity_vs_pypdf"] = {
+            "mean": round(statistics.mean(ratios), 4) if ratios else None,
+            "min": round(min(ratios), 4) if ratios else None,
+        }
+    return report
+
+
+HEAVY_MODULES = ["openai", "fitz", "pypdf", "docx", "PIL", "pytesseract", "bs4", "genanki", "apscheduler", "requests"]
+
+
+def measure_startup(repeat: int = 5) -> dict:
+    root = Path(__file__).resolve().parent.parent
+    probe = (
+        "import sys, time; t = time.perf_counter(); import src.app; "
+        "print(time.perf_counter() - t); "
+        f"print(','.join(m for m in {HEAVY_MODULES!r} if m in sys.modules))"
+    )
+
+    def wall(cmd: list[str]) -> float:
+        samples = []
+        for _ in range(max(1, repeat)):
+            t0 = time.perf_counter()
+            subprocess.run(cmd, cwd=root, capture_output=True, check=False)
+            samples.append(time.perf_counter() - t0)
+        return round(statistics.median(samples) * 1000, 1)
+
+    out = subprocess.run(
+        [sys.executable, "-c", probe], cwd=root, capture_output=True, text=True, check=False
+    ).stdout.split("\n")
+    # What `status` imports: the CLI and the state reader, nothing else.
+    cli = subprocess.run(
+        [sys.executable, "-c", "import time; t = time.perf_counter(); import src.cli, src.status; print(time.perf_counter() - t)"],
+        cwd=root,
+        capture_output=True,
+        text=True,
+        check=False,
+    ).stdout.strip()
+    return {
+        "python_noop_ms": wall([sys.executable, "-c", "pass"]),
+        "import_app_ms": round(float(out[0]) * 1000, 1) if out and out[0] else None,
+        "import_status_ms": round(float(cli) * 1000, 1) if cli else None,
+        "heavy_modules_after_import": [m for m in (out[1] if len(out) > 1 else "").split(",") if m],
+        "status_ms": wall([sys.executable, "run.py", "status"]),
+        "help_ms": wall([sys.executable, "run.py", "--help"]),
+    }
+
+
+def _git_revision() -> dict:
+    root = Path(__file__).resolve().parent.parent
+    try:
+        rev = subprocess.run(
+            ["git", "rev-parse", "HEAD"], cwd=root, capture_output=True, text=True, check=True
+        ).stdout.strip()
+        dirty = bool(
+            subprocess.run(
+                ["git", "status", "--porcelain", "--untracked-files=no"],
+                cwd=root,
+                capture_output=True,
+                text=True,
+            ).stdout.strip()
+        )
+    except Exception:
+        return {"commit": None, "dirty": None}
+    return {"commit": rev, "dirty": dirty}
+
+
+def _bench_settings(base, root: Path, stub: StubServer, smtp: SmtpStub):
+    return replace(
+        base,
+        content_dir=root / "content",
+        state_file=root / "state" / "state.json",
+        output_dir=root / "output",
+        cache_dir=root / "state" / "cache",
+        openai_api_key="bench",
+        openai_base_url=f"{stub.base_url}/v1",
+        ankiconnect_url=f"{stub.base_url}/anki",
+        smtp_host="127.0.0.1",
+        smtp_port=smtp.server_address[1],
+        smtp_username="bench",
+        smtp_password="bench",
+        smtp_from="bench@localhost",
+        smtp_to="bench@localhost",
+        smtp_starttls=False,
+    )
+
+
+def _bench_size(
+    base_settings,
+    work: Path,
+    size: int,
+    params: BenchParams,
+    stub: StubServer,
+    smtp: SmtpStub,
+    with_images: bool,
+    pdf_backends: bool = False,
+) -> dict:
+    from .app import choose_daily_selection, collect_packets, run_once, sync_sources
+
+    root = work / f"size-{size}"
+    settings = _bench_settings(base_settings, root, stub, smtp)
+    t0 = time.perf_counter()
+    corpus = build_corpus(settings.content_dir, size, params, stub.base_url, with_images)
+    corpus["build_s"] = round(time.perf_counter() - t0, 3)
+
+    timings: dict[str, dict] = {}
+
+    def cold_sync():
+        shutil.rmtree(settings.state_file.parent, ignore_errors=True)
+        sync_sources(settings, load_state(settings.state_file))
+
+    timings["sync_sources_cold"] = _timed(cold_sync, params.repeat)
+
+    state = load_state(settings.state_file)
+    sync_sources(settings, state)
+    timings["sync_sources_warm"] = _timed(lambda: sync_sources(settings, state), params.repeat)
+    corpus["units"] = sum(m.units for m in state.sources.values())
+
+    sel = choose_daily_selection(settings, state)
+    packets: list[dict] = []
+
+    def collect():
+        packets[:] = collect_packets(settings, state, sel)
+
+    timings["collect_packets"] = _timed(collect, params.repeat)
+
+    def full_run():
+        shutil.rmtree(settings.state_file.parent, ignore_errors=True)
+        run_once(settings)
+
+    calls_before = dict(stub.calls)
+    http_before = get_transport(settings.http).snapshot()
+    timings["run_once"] = _timed(full_run, params.repeat)
+    http = metrics_delta(http_before, get_transport(settings.http).snapshot())
+    # The deadline's budget checks (links, vision, lesson length) must also
+    # hold with the deadline switched off; one untimed run covers that.
+    shutil.rmtree(settings.state_file.parent, ignore_errors=True)
+    run_once(replace(settings, deadline=replace(settings.deadline, enabled=False)))
+    row = {
+        "size": size,
+        "corpus": corpus,
+        "packets": {"count": len(packets), "chars": sum(len(p.get("text") or "") for p in packets)},
+        "timings": timings,
+        "stub_calls_per_run": {
+            k: (v - calls_before.get(k, 0)) / max(1, params.repeat) for k, v in stub.calls.items()
+        },
+        "http_per_run": {
+            host: {k: v / max(1, params.repeat) for k, v in row.items()} for host, row in http.items()
+        },
+    }
+    if pdf_backends:
+        row["pdf_backends"] = compare_pdf_backends(sorted(settings.content_dir.glob("*.pdf")))
+    return row
+
+
+def run_bench(
+    params: BenchParams,
+    out: Path | None = None,
+    keep: bool = False,
+    startup_only: bool = False,
+    pdf_backends: bool = False,
+    pdf_sample: Path | None = None,
+    with_images: bool = True,
+) -> dict:
+    base_settings = load_settings()
+    startup = measure_startup()
+    print(
+        f"startup: import src.app={startup['import_app_ms']}ms import status path={startup['import_status_ms']}ms "
+        f"status={startup['status_ms']}ms "
+        f"(python noop {startup['python_noop_ms']}ms) heavy modules={startup['heavy_modules_after_import'] or 'none'}"
+    )
+    if startup_only:
+        params = replace(params, sizes=[])
+    stub = StubServer(
+        {
+            "openai": params.openai_latency_ms / 1000,
+            "anki": params.anki_latency_ms / 1000,
+            "web": params.web_latency_ms / 1000,
+        }
+    )
+    smtp = SmtpStub(params.smtp_latency_ms / 1000)
+    _serve(stub)
+    _serve(smtp)
+
+    work = Path(tempfile.mkdtemp(prefix="mentorloop-bench-"))
+    results = []
+    try:
+        for size in params.sizes:
+            row = _bench_size(base_settings, work, size, params, stub, smtp, with_images, pdf_backends)
+            results.append(row)
+            print(
+                f"size={size:<4} units={row['corpus']['units']:<7} "
+                + " ".join(f"{k}={v['median_s']:.3f}s" for k, v in row["timings"].items())
+            )
+            for name, r in (row.get("pdf_backends") or {}).items():
+                print(f"  pdf {name:<8} {r['pages_per_sec']} pages/s parity={r.get('parity_vs_pypdf', '-')}")
+    finally:
+        stub.shutdown()
+        smtp.shutdown()
+        if not keep:
+            shutil.rmtree(work, ignore_errors=True)
+
+    report = {
+        "schema": 1,
+        "timestamp": datetime.now().isoformat(timespec="seconds"),
+        **_git_revision(),
+        "python": sys.version.split()[0],
+        "platform": platform.platform(),
+        "images_included": with_images,
+        "tesseract_available": shutil.which("tesseract") is not None,
+        "params": params.__dict__,
+        "startup": startup,
+        "results": results,
+    }
+    if pdf_sample:
+        sample = sorted(pdf_sample.rglob("*.pdf")) if pdf_sample.is_dir() else [pdf_sample]
+        report["pdf_backends_sample"] = {"files": [str(p) for p in sample], **compare_pdf_backends(sample)}
+        for name in ("pypdf", "pymupdf"):
+            r = report["pdf_backends_sample"].get(name) or {}
+            print(f"sample pdf {name:<8} {r.get('pages_per_sec')} pages/s parity={r.get('parity_vs_pypdf', '-')}")
+    if out is None:
+        stamp = datetime.now().strftime("%Y%m%d-%H%M%S")
+        rev = (report["commit"] or "nogit")[:10]
+        out = base_settings.output_dir / "bench" / f"bench-{rev}-{stamp}.json"
+    out.parent.mkdir(parents=True, exist_ok=True)
+    out.write_text(json.dumps(report, indent=2), encoding="utf-8")
+    print(f"results written to {out}")
+    if keep:
+        print(f"corpus kept in {work}")
+    return report
+
+
+def compare_reports(old: dict, new: dict) -> list[str]:
+    old_rows = {r["size"]: r for r in old.get("results", [])}
+    lines = [f"{(old.get('commit') or '?')[:10]} -> {(new.get('commit') or '?')[:10]}"]
+    for key in ("import_app_ms", "import_status_ms", "status_ms"):
+        before = (old.get("startup") or {}).get(key)
+        after = (new.get("startup") or {}).get(key)
+        if before and after:
+            lines.append(f"startup {key:<14} {before}ms -> {after}ms")
+    for row in new.get("results", []):
+        prev = old_rows.get(row["size"])
+        if not prev:
+            continue
+        for name, r in (row.get("pdf_backends") or {}).items():
+            before = ((prev.get("pdf_backends") or {}).get(name) or {}).get("pages_per_sec")
+            if before and r.get("pages_per_sec"):
+                lines.append(f"size={row['size']:<4} pdf {name:<14} {before} -> {r['pages_per_sec']} pages/s")
+        for stage, t in row["timings"].items():
+            before = (prev["timings"].get(stage) or {}).get("median_s")
+            if not before:
+                continue
+            delta = (t["median_s"] - before) / before * 100
+            lines.append(
+                f"size={row['size']:<4} {stage:<18} {before:.3f}s -> {t['median_s']:.3f}s ({delta:+.1f}%)"
+            )
+    return lines
+
+
+def _int_list(raw: str) -> list[int]:
+    return [int(x) for x in raw.split(",") if x.strip()]
+
+
+def bench_main(args) -> None:
+    def latency(v):
+        return args.latency_ms if v is None else v
+
+    params = BenchParams(
+        sizes=_int_list(args.sizes),
+        repeat=args.repeat,
+        pdf_pages=args.pdf_pages,
+        text_words=args.text_words,
+        docx_paragraphs=args.docx_paragraphs,
+        openai_latency_ms=latency(args.openai_latency_ms),
+        anki_latency_ms=latency(args.anki_latency_ms),
+        web_latency_ms=latency(args.web_latency_ms),
+        smtp_latency_ms=latency(args.smtp_latency_ms),
+    )
+    report = run_bench(
+        params,
+        out=args.out,
+        keep=args.keep,
+        startup_only=args.startup_only,
+        pdf_backends=args.pdf_backends,
+        pdf_sample=args.pdf_sample,
+        with_images=not args.no_images,
+    )
+    if args.compare:
+        old = json.loads(args.compare.read_text(encoding="utf-8"))
+        for line in compare_reports(old, report):
+            print(line)
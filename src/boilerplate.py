@@ -0,0 +1,119 @@
+from __future__ import annotations
+
+from collections import Counter
+from collections.abc import Iterable
+from pathlib import Path
+import json
+import os
+import re
+
+PROFILE_VERSION = 2
+
+_DIGITS = re.compile(r"\d+")
+_SPACE = re.compile(r"\s+")
+_ROMAN = r"m{0,3}(?:cm|cd|d?c{0,3})(?:xc|xl|l?x{0,3})(?:ix|iv|v?i{0,3})"
+# "Page 12", "S. xii", "12 / 300": the line says it is a page number.
+_PAGE_MARKER = re.compile(
+    rf"^[-–—\s]*(?:(?:page|seite|s\.|p\.)\s*(?:\d{{1,4}}|(?=[ivxlcdm]){_ROMAN})"
+    r"(?:\s*(?:/|of|von)\s*\d{1,4})?|\d{1,4}\s*(?:/|of|von)\s*\d{1,4})[-–—\s]*$",
+    re.IGNORECASE,
+)
+# "12", "- xii -": only a page number when the neighbouring pages count on from it.
+_BARE_NUMBER = re.compile(rf"^[-–—\s]*(\d{{1,4}}|(?=[ivxlcdm]){_ROMAN})[-–—\s]*$", re.IGNORECASE)
+_ROMAN_VALUES = {"i": 1, "v": 5, "x": 10, "l": 50, "c": 100, "d": 500, "m": 1000}
+
+
+def normalize_line(line: str) -> str:
+    # Running heads differ only by their numbers ("Kapitel 3 · 45"), so digits collapse.
+    return _SPACE.sub(" ", _DIGITS.sub("#", line.strip().casefold()))
+
+
+def is_page_number(line: str) -> bool:
+    return bool(_PAGE_MARKER.match(line.strip()))
+
+
+def _bare_number(line: str) -> int | None:
+    m = _BARE_NUMBER.match(line.strip())
+    if not m:
+        return None
+    token = m.group(1).casefold()
+    if token.isdigit():
+        return int(token)
+    values = [_ROMAN_VALUES[c] for c in token]
+    return sum(-v if v < nxt else v for v, nxt in zip(values, values[1:] + [0]))
+
+
+def _edges(lines: list[str], edge_lines: int) -> list[str]:
+    return lines[:edge_lines] + lines[-edge_lines:] if len(lines) > edge_lines else lines
+
+
+def build_profile(pages: Iterable[str], edge_lines: int = 3, min_share: float = 0.3, min_pages: int = 3) -> dict:
+    # A line is boilerplate when (normalised) it sits in the top or bottom
+    # `edge_lines` of enough pages. Lines in the body are never counted. Bare
+    # numbers are not counted either (they would all normalise to "#"); one
+    # is a page's number only when the page before or after has its
+    # predecessor or successor at its edge, so a year or a lone "mix" stays.
+    counts: Counter[str] = Counter()
+    numbers: list[dict[str, int]] = []
+    for text in pages:
+        lines = [ln.strip() for ln in (text or "").splitlines() if ln.strip()]
+        edges = [ln for ln in _edges(lines, edge_lines) if len(ln) <= 200]
+        bare = {ln: v for ln in edges if (v := _bare_number(ln)) is not None}
+        numbers.append(bare)
+        counts.update({normalize_line(ln) for ln in edges if ln not in bare})
+    n = len(numbers)
+    threshold = max(min_pages, min_share * n)
+    lines = sorted(k for k, c in counts.items() if k and c >= threshold) if n >= 2 * min_pages else []
+    page_numbers = {}
+    for i, bare in enumerate(numbers):
+        before = set(numbers[i - 1].values()) if i else set()
+        after = set(numbers[i + 1].values()) if i + 1 < n else set()
+        found = sorted(ln for ln, v in bare.items() if v - 1 in before or v + 1 in after)
+        if found:
+            page_numbers[str(i)] = found
+    return {"version": PROFILE_VERSION, "pages": n, "edge_lines": edge_lines, "lines": lines, "page_numbers": page_numbers}
+
+
+def strip_boilerplate(text: str, profile: dict | None, page: int | None = None) -> str:
+    # Only leading and trailing lines are dropped, and only while they match,
+    # so a repeated phrase inside the page body is kept.
+    if not text or not profile:
+        return text
+    known = set(profile.get("lines") or [])
+    numbered = set((profile.get("page_numbers") or {}).get(str(page), [])) if page is not None else set()
+    edge = int(profile.get("edge_lines") or 3)
+    lines = text.splitlines()
+
+    def drop(line: str) -> bool:
+        return not line.strip() or is_page_number(line) or line.strip() in numbered or normalize_line(line) in known
+
+    start, dropped = 0, 0
+    while start < len(lines) and dropped < edge and drop(lines[start]):
+        dropped += bool(lines[start].strip())
+        start += 1
+    end, dropped = len(lines), 0
+    while end > start and dropped < edge and drop(lines[end - 1]):
+        dropped += bool(lines[end - 1].strip())
+        end -= 1
+    return "\n".join(lines[start:end])
+
+
+class BoilerplateCache:
+    def __init__(self, cache_dir: Path) -> None:
+        self.dir = cache_dir / "boilerplate"
+
+    def get(self, fingerprint: str) -> dict | None:
+        p = self.dir / f"{fingerprint}.json"
+        if not p.exists():
+            return None
+        try:
+            profile = json.loads(p.read_text(encoding="utf-8"))
+        except (OSError, ValueError):
+            return None
+        return profile if profile.get("version") == PROFILE_VERSION else None
+
+    def put(self, fingerprint: str, profile: dict) -> None:
+        self.dir.mkdir(parents=True, exist_ok=True)
+        tmp = self.dir / f"{fingerprint}.tmp"
+        tmp.write_text(json.dumps(profile, ensure_ascii=False), encoding="utf-8")
+        os.replace(tmp, self.dir / f"{fingerprint}.json")
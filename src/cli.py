@@ -0,0 +1,87 @@
+from __future__ import annotations
+
+from pathlib import Path
+import argparse
+import sys
+
+# The command line only. Each command imports what it needs when it runs, so
+# `status` never loads the pipeline and `--help` answers straight away.
+
+
+def _add_bench_arguments(parser) -> None:
+    parser.add_argument("--sizes", default="1,3,9", help="comma-separated corpus sizes (documents per type)")
+    parser.add_argument("--repeat", type=int, default=1)
+    parser.add_argument("--pdf-pages", type=int, default=120)
+    parser.add_argument("--text-words", type=int, default=60000)
+    parser.add_argument("--docx-paragraphs", type=int, default=1500)
+    parser.add_argument("--latency-ms", type=int, default=0, help="default latency for every stub service")
+    parser.add_argument("--openai-latency-ms", type=int)
+    parser.add_argument("--anki-latency-ms", type=int)
+    parser.add_argument("--web-latency-ms", type=int)
+    parser.add_argument("--smtp-latency-ms", type=int)
+    parser.add_argument("--out", type=Path)
+    parser.add_argument("--compare", type=Path, help="previous results file to diff against")
+    parser.add_argument("--keep", action="store_true", help="keep the generated corpus")
+    parser.add_argument("--no-images", action="store_true", help="leave images out of the generated corpus")
+    parser.add_argument("--startup-only", action="store_true", help="only measure CLI start-up time")
+    parser.add_argument("--pdf-backends", action="store_true", help="compare PDF text backends on the corpus")
+    parser.add_argument("--pdf-sample", type=Path, help="PDF file or folder to compare PDF text backends on")
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="MentorLoop")
+    sub = parser.add_subparsers(dest="cmd", required=True)
+    run_cmd = sub.add_parser("run-once")
+    run_cmd.add_argument("--fresh", action="store_true", help="ignore today's checkpoints and start over")
+    run_cmd.add_argument("--local", action="store_true", help="run in this process even if `serve` is running")
+    run_cmd.add_argument("--no-wait", action="store_true", help="exit with status 75 if another run is in progress")
+    sub.add_parser("serve")
+    sub.add_parser("status", help="print cursors and remaining units from state")
+    search_cmd = sub.add_parser("search", help="full-text search over indexed units")
+    search_cmd.add_argument("query")
+    search_cmd.add_argument("--limit", type=int, default=10)
+    report_cmd = sub.add_parser("report", help="token usage and cost from the ledger")
+    report_cmd.add_argument("--days", type=int, default=30)
+    report_cmd.add_argument("--by", choices=["day", "month", "stage", "model"], default="day")
+    batch_cmd = sub.add_parser("batch", help="generate lessons and decks for several days at once")
+    batch_cmd.add_argument("--days", type=int, default=7)
+    batch_cmd.add_argument("--no-wait", action="store_true", help="exit with status 75 if another run is in progress")
+    bench = sub.add_parser("bench", help="time ingestion and the pipeline against local stubs")
+    _add_bench_arguments(bench)
+    args = parser.parse_args()
+
+    if args.cmd == "status":
+        from .status import status
+
+        status()
+        return
+    from .runlock import RunInProgress
+
+    try:
+        _dispatch(args)
+    except RunInProgress as e:
+        print(f"{args.cmd}: {e}", file=sys.stderr)
+        raise SystemExit(75)
+
+
+def _dispatch(args) -> None:
+    from .app import forward_to_daemon, report, run_batch, run_once, search, serve
+
+    if args.cmd == "run-once":
+        if not args.local and forward_to_daemon(args.fresh, wait=not args.no_wait):
+            return
+        result = run_once(fresh=args.fresh, wait=not args.no_wait)
+        if result.get("attached"):
+            print(f"attached to the run in progress: it finished at {result.get('ts')}")
+    elif args.cmd == "report":
+        report(args.days, args.by)
+    elif args.cmd == "batch":
+        run_batch(args.days, wait=not args.no_wait)
+    elif args.cmd == "serve":
+        serve()
+    elif args.cmd == "search":
+        search(args.query, args.limit)
+    elif args.cmd == "bench":
+        from .bench import bench_main
+
+        bench_main(args)
@@ -1,6 +1,6 @@
 from __future__ import annotations
 
-from dataclasses import dataclass
+from dataclasses import dataclass, field
 from pathlib import Path
 import os
 
@@ -22,6 +22,10 @@ class AnkiPrefs:
     max_cards: int
     failed_card_lookback_days: int
     failed_card_limit: int
+    delivery: str = "apkg"
+    deck_name: str = "MentorLoop"
+    note_type: str = "MentorLoop Basic"
+    batch_size: int = 500
 
 
 @dataclass
@@ -30,6 +34,11 @@ class IngestionPrefs:
     default_links_per_day: int
     chunk_words: int
     max_total_units_per_day: int
+    ocr_workers: int = 2
+    ocr_max_side: int = 2400
+    ocr_skip_when_vision: bool = True
+    pdf_backend: str = "pymupdf"
+    strip_boilerplate: bool = True
 
 
 @dataclass
@@ -40,6 +49,92 @@ class OpenAIPrefs:
     enable_image_vision: bool
     vision_max_pages_per_day: int
     vision_max_images_per_day: int
+    vision_triage: bool = True
+    vision_min_visual_coverage: float = 0.05
+    vision_min_text_chars: int = 40
+    vision_batch_max_images: int = 4
+    vision_batch_max_tokens: int = 8000
+    card_shards: bool = True
+    card_shard_workers: int = 4
+    card_shard_retries: int = 1
+    card_shard_min_words: int = 250
+    map_reduce: bool = True
+    map_reduce_threshold_chars: int = 80000
+    map_reduce_max_notes_chars: int = 60000
+    map_packet_max_chars: int = 40000
+    map_fallback_chars: int = 4000
+    map_workers: int = 4
+    batch_workers: int = 2
+    hedge_lesson: bool = False
+    hedge_percentile: float = 0.9
+    hedge_min_samples: int = 5
+    hedge_min_delay_seconds: float = 10.0
+    hedge_fallback_model: str = ""
+    hedge_max_per_day: int = 2
+
+
+@dataclass
+class SearchPrefs:
+    enabled: bool = True
+    passages_per_failure: int = 2
+    max_context_chars: int = 6000
+
+
+@dataclass
+class HttpPrefs:
+    max_connections_per_host: int = 8
+    max_hosts: int = 16
+    connect_timeout: float = 5.0
+    read_timeout: float = 30.0
+    openai_timeout: float = 600.0
+
+
+@dataclass
+class BudgetPrefs:
+    daily_usd: float = 0.0
+    monthly_usd: float = 0.0
+    daily_tokens: int = 0
+    monthly_tokens: int = 0
+    prices: dict = field(default_factory=dict)
+
+
+@dataclass
+class DeadlinePrefs:
+    enabled: bool = True
+    minutes: float = 45.0
+    skip_vision_after: float = 0.3
+    drop_links_after: float = 0.4
+    shrink_lesson_after: float = 0.45
+    skip_planner_after: float = 0.5
+    min_lesson_scale: float = 0.25
+
+
+@dataclass
+class DaemonPrefs:
+    enabled: bool = True
+    host: str = "127.0.0.1"
+    port: int = 0
+
+
+@dataclass
+class DedupePrefs:
+    enabled: bool = True
+    max_text_distance: int = 8
+    max_image_distance: int = 48
+    min_words: int = 50
+    min_length_ratio: float = 0.8
+
+
+@dataclass
+class LockPrefs:
+    wait_minutes: float = 60.0
+
+
+@dataclass
+class WatchPrefs:
+    enabled: bool = True
+    debounce_seconds: float = 3.0
+    poll_seconds: float = 10.0
 
 
 @dataclass
@@ -50,12 +145,14 @@ class Settings:
     content_dir: Path
     state_file: Path
     output_dir: Path
+    cache_dir: Path
     lesson: LessonPrefs
     anki: AnkiPrefs
     ingestion: IngestionPrefs
     openai: OpenAIPrefs
 
     openai_api_key: str
+    openai_base_url: str
     openai_model: str
     openai_vision_model: str
 
@@ -65,10 +162,19 @@ class Settings:
     smtp_password: str
     smtp_from: str
     smtp_to: str
+    smtp_starttls: bool
 
     ankiconnect_url: str
     
     language: LanguagePrefs
+    search: SearchPrefs
+    watch: WatchPrefs
+    http: HttpPrefs
+    deadline: DeadlinePrefs
+    budget: BudgetPrefs
+    daemon: DaemonPrefs
+    dedupe: DedupePrefs
+    lock: LockPrefs
 
 @dataclass
 class LanguagePrefs:
@@ -108,11 +214,13 @@ def load_settings(config_path: str = "config.yaml") -> Settings:
         content_dir=Path(cfg["content_dir"]),
         state_file=Path(cfg["state_file"]),
         output_dir=Path(cfg["output_dir"]),
+        cache_dir=Path(cfg.get("cache_dir", "state/cache")),
         lesson=LessonPrefs(**cfg["lesson"]),
         anki=AnkiPrefs(**cfg["anki"]),
         ingestion=IngestionPrefs(**cfg["ingestion"]),
         openai=OpenAIPrefs(**cfg["openai"]),
         openai_api_key=get_env("OPENAI_API_KEY", ""),
+        openai_base_url=get_env("OPENAI_BASE_URL", ""),
         openai_model=get_env("OPENAI_MODEL", "gpt-4.1-mini"),
         openai_vision_model=get_env(
             "OPENAI_VISION_MODEL", get_env("OPENAI_MODEL", "gpt-4.1-mini")
@@ -123,6 +231,15 @@ def load_settings(config_path: str = "config.yaml") -> Settings:
         smtp_password=get_env("SMTP_PASSWORD", ""),
         smtp_from=get_env("SMTP_FROM", ""),
         smtp_to=get_env("SMTP_TO", ""),
+        smtp_starttls=get_env("SMTP_STARTTLS", "true").lower() not in {"0", "false", "no"},
         ankiconnect_url=get_env("ANKICONNECT_URL", "http://127.0.0.1:8765"),
         language=LanguagePrefs(**cfg["language"]),
+        search=SearchPrefs(**(cfg.get("search") or {})),
+        watch=WatchPrefs(**(cfg.get("watch") or {})),
+        http=HttpPrefs(**(cfg.get("http") or {})),
+        deadline=DeadlinePrefs(**(cfg.get("deadline") or {})),
+        budget=BudgetPrefs(**(cfg.get("budget") or {})),
+        daemon=DaemonPrefs(**(cfg.get("daemon") or {})),
+        dedupe=DedupePrefs(**(cfg.get("dedupe") or {})),
+        lock=LockPrefs(**(cfg.get("lock") or {})),
     )
@@ -0,0 +1,210 @@
+from __future__ import annotations
+
+from datetime import datetime
+from pathlib import Path
+import json
+import os
+import secrets
+import threading
+import time
+from typing import Callable
+
+
+def port_file(settings) -> Path:
+    return settings.state_file.parent / "daemon.json"
+
+
+class Daemon:
+    # The resident half of `serve`: one lock for everything that writes
+    # state.json, and at most one run at a time. A trigger that arrives while
+    # a run is in progress attaches to it instead of starting another.
+    def __init__(self, run: Callable[[bool], dict | None], sync: Callable[[], None]) -> None:
+        self._run = run
+        self._sync = sync
+        self.lock = threading.Lock()
+        self._cv = threading.Condition()
+        self.started_at = datetime.now().isoformat(timespec="seconds")
+        self.running: dict | None = None
+        self.last_run: dict | None = None
+        self._runs = 0
+
+    def sync(self) -> None:
+        with self.lock:
+            self._sync()
+
+    def trigger(self, fresh: bool = False, wait: bool = True, source: str = "manual") -> dict:
+        with self._cv:
+            if self.running is not None:
+                current = self.running
+                if not wait:
+                    return {**current, "attached": True}
+                while self.running is current:
+                    self._cv.wait()
+                return {**(self.last_run or {}), "attached": True}
+            self._runs += 1
+            self.running = {
+                "run": self._runs,
+                "trigger": source,
+                "fresh": fresh,
+                "started_at": datetime.now().isoformat(timespec="seconds"),
+            }
+            info = dict(self.running)
+        if wait:
+            return self._execute(info)
+        threading.Thread(target=self._execute, args=(info,), daemon=True).start()
+        return {**info, "started": True}
+
+    def _execute(self, info: dict) -> dict:
+        t0 = time.perf_counter()
+        result = dict(info)
+        try:
+            with self.lock:
+                metrics = self._run(info["fresh"])
+            result.update(ok=True, metrics=metrics or {})
+        except Exception as e:
+            result.update(ok=False, error=f"{type(e).__name__}: {e}")
+        result["finished_at"] = datetime.now().isoformat(timespec="seconds")
+        result["duration_s"] = round(time.perf_counter() - t0, 3)
+        with self._cv:
+            self.last_run = result
+            self.running = None
+            self._cv.notify_all()
+        return result
+
+    def status(self) -> dict:
+        with self._cv:
+            return {
+                "pid": os.getpid(),
+                "started_at": self.started_at,
+                "running": self.running,
+                "last_run": self.last_run,
+            }
+
+
+def start_http(daemon: Daemon, settings, status_extra: Callable[[], dict], metrics_extra: Callable[[], dict]):
+    from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+    token = secrets.token_urlsafe(24)
+
+    class Handler(BaseHTTPRequestHandler):
+        def log_message(self, format, *args):
+            pass
+
+        def _send(self, code: int, obj: dict) -> None:
+            data = json.dumps(obj, ensure_ascii=False, default=str).encode("utf-8")
+            self.send_response(code)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(data)))
+            self.end_headers()
+            self.wfile.write(data)
+
+        def do_GET(self):
+            if self.path == "/status":
+                self._send(200, {**daemon.status(), **status_extra()})
+            elif self.path == "/metrics":
+                last = daemon.status()["last_run"] or {}
+                self._send(200, {"last_run": last.get("metrics"), **metrics_extra()})
+            else:
+                self._send(404, {"error": "not found"})
+
+        def do_POST(self):
+            if self.path != "/run":
+                self._send(404, {"error": "not found"})
+                return
+            # Only callers that can read the port file (same user) may trigger runs.
+            if not secrets.compare_digest(self.headers.get("X-Token", ""), token):
+                self._send(403, {"error": "bad token"})
+                return
+            length = int(self.headers.get("Content-Length") or 0)
+            body = json.loads(self.rfile.read(length) or b"{}") if length else {}
+            result = daemon.trigger(
+                fresh=bool(body.get("fresh")), wait=bool(body.get("wait", True)), source="http"
+            )
+            self._send(200, result)
+
+    server = ThreadingHTTPServer((settings.daemon.host, settings.daemon.port), Handler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, name="daemon-http", daemon=True).start()
+
+    path = port_file(settings)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp = path.with_suffix(".tmp")
+    fd = os.open(tmp, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+    with os.fdopen(fd, "w", encoding="utf-8") as f:
+        json.dump(
+            {
+                "pid": os.getpid(),
+                "host": server.server_address[0],
+                "port": server.server_address[1],
+                "token": token,
+                "started_at": daemon.started_at,
+            },
+            f,
+        )
+    os.replace(tmp, path)
+    return server
+
+
+def stop_http(server, settings) -> None:
+    server.shutdown()
+    server.server_close()
+    path = port_file(settings)
+    try:
+        if json.loads(path.read_text(encoding="utf-8")).get("pid") == os.getpid():
+            path.unlink()
+    except (OSError, ValueError):
+        pass
+
+
+def _pid_alive(pid: int) -> bool:
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except (PermissionError, OSError):
+        return True
+    return True
+
+
+def find_daemon(settings) -> dict | None:
+    path = port_file(settings)
+    try:
+        info = json.loads(path.read_text(encoding="utf-8"))
+    except (OSError, ValueError):
+        return None
+    if not _pid_alive(int(info.get("pid") or 0)):
+        return None
+    return info
+
+
+def daemon_request(info: dict, method: str, path: str, body: dict | None = None, timeout: float | None = 5):
+    from urllib.request import Request, urlopen
+
+    data = json.dumps(body or {}).encode("utf-8") if method == "POST" else None
+    req = Request(
+        f"http://{info['host']}:{info['port']}{path}",
+        data=data,
+        method=method,
+        headers={"Content-Type": "application/json", "X-Token": info.get("token", "")},
+    )
+    with urlopen(req, timeout=timeout) as resp:
+        return json.loads(resp.read() or b"{}")
+
+
+def forward_timeout(settings) -> float:
+    # A forwarded run may first wait for the run lock, then has its delivery window.
+    return (max(0.0, settings.lock.wait_minutes) + max(1.0, settings.deadline.minutes)) * 60
+
+
+def forward_run(settings, fresh: bool = False, wait: bool = True) -> dict | None:
+    # None when no daemon answers; the caller then runs in-process.
+    info = find_daemon(settings)
+    if info is None:
+        return None
+    try:
+        daemon_request(info, "GET", "/status", timeout=2)
+    except Exception:
+        return None
+    return daemon_request(
+        info, "POST", "/run", {"fresh": fresh, "wait": wait}, timeout=forward_timeout(settings) if wait else 10
+    )
@@ -0,0 +1,65 @@
+from __future__ import annotations
+
+from datetime import datetime, timedelta
+from zoneinfo import ZoneInfo
+import time
+
+from .config import DeadlinePrefs
+
+
+class Deadline:
+    # Delivery is due `prefs.minutes` after the scheduled time (or after the
+    # start of an off-schedule run). Each degradation has a threshold, as a
+    # share of that window; once elapsed time passes it, the step is cut.
+    # Thresholds increase in the order things are given up: vision, links,
+    # lesson length, the planner call.
+    def __init__(self, prefs: DeadlinePrefs, started_at: datetime | None = None) -> None:
+        self.prefs = prefs
+        now = datetime.now(started_at.tzinfo if started_at else None)
+        started_at = started_at or now
+        self.total = max(1.0, prefs.minutes * 60)
+        self.due_at = started_at + timedelta(seconds=self.total)
+        self._t0 = time.monotonic() - (now - started_at).total_seconds()
+        self.degradations: list[dict] = []
+
+    @classmethod
+    def for_run(cls, prefs: DeadlinePrefs, timezone: str, schedule_hour: int, schedule_minute: int) -> "Deadline":
+        # A run (or a resumed run) inside today's delivery window is measured
+        # from the scheduled time, so a late start counts against the budget.
+        # The schedule is in the configured timezone, as for the scheduler.
+        now = datetime.now(ZoneInfo(timezone))
+        scheduled = now.replace(hour=schedule_hour, minute=schedule_minute, second=0, microsecond=0)
+        if scheduled <= now < scheduled + timedelta(minutes=prefs.minutes):
+            return cls(prefs, scheduled)
+        return cls(prefs, now)
+
+    def elapsed(self) -> float:
+        return time.monotonic() - self._t0
+
+    def remaining(self) -> float:
+        return self.total - self.elapsed()
+
+    def seconds_until(self, share: float) -> float:
+        if not self.prefs.enabled:
+            return float("inf")
+        return share * self.total - self.elapsed()
+
+    def past(self, share: float) -> bool:
+        return self.seconds_until(share) <= 0
+
+    def degrade(self, stage: str, action: str, **detail) -> None:
+        self.degradations.append(
+            {
+                "stage": stage,
+                "action": action,
+                "elapsed_s": round(self.elapsed(), 1),
+                "due_at": self.due_at.isoformat(timespec="seconds"),
+                **detail,
+            }
+        )
+
+    def lesson_scale(self) -> float:
+        if not self.past(self.prefs.shrink_lesson_after):
+            return 1.0
+        window = (1 - self.prefs.shrink_lesson_after) * self.total
+        return max(self.prefs.min_lesson_scale, min(1.0, self.remaining() / max(1.0, window)))
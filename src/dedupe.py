@@ -0,0 +1,125 @@
+from __future__ import annotations
+
+from array import array
+from collections.abc import Iterable
+from pathlib import Path
+from urllib.parse import parse_qsl, urlencode, urlsplit, urlunsplit
+import hashlib
+import re
+import sys
+
+_WORD = re.compile(r"\w+", re.UNICODE)
+_MASK = (1 << 64) - 1
+_DHASH_SIZE = 32
+# _BITS[b] maps a byte to 1 when bit b is set, so one translate().count() tallies a bit column.
+_BITS = [bytes((v >> b) & 1 for v in range(256)) for b in range(8)]
+_TRACKING_PARAMS = {"fbclid", "gclid", "dclid", "msclkid", "mc_cid", "mc_eid", "igshid", "ref", "ref_src"}
+
+
+def hamming(a: int, b: int) -> int:
+    return (a ^ b).bit_count()
+
+
+def _h64(s: str) -> int:
+    return int.from_bytes(hashlib.blake2b(s.encode("utf-8"), digest_size=8).digest(), "little")
+
+
+def _word_hash(word: str) -> tuple[int, int, int]:
+    # The word's hash as it enters a shingle in first, second and third place.
+    h = _h64(word)
+    return h, ((h << 21) | (h >> 43)) & _MASK, ((h << 42) | (h >> 22)) & _MASK
+
+
+class SimHash:
+    # 64-bit SimHash over the set of word 3-shingles, fed unit by unit.
+    # Shingles run across unit boundaries, so a PDF (pages) and its DOCX
+    # export (word chunks) hash the same text the same way; each distinct
+    # shingle counts once, so a running head on every page does not outvote
+    # the body. Words are hashed once each; a shingle's hash is the XOR of
+    # its word hashes rotated by position.
+    def __init__(self) -> None:
+        self._hashes: set[int] = set()
+        self._vocab: dict[str, tuple[int, int, int]] = {}
+        self._carry: list[tuple[int, int, int]] = []
+        self.words = 0
+
+    def update(self, text: str) -> None:
+        words = _WORD.findall((text or "").casefold())
+        if not words:
+            return
+        self.words += len(words)
+        vocab = self._vocab
+        ids = self._carry + [vocab.get(w) or vocab.setdefault(w, _word_hash(w)) for w in words]
+        self._hashes.update(a[0] ^ b[1] ^ c[2] for a, b, c in zip(ids, ids[1:], ids[2:]))
+        self._carry = ids[-2:]
+
+    def hexdigest(self) -> str:
+        return f"{self.digest():016x}"
+
+    def digest(self) -> int:
+        hashes = array("Q", self._hashes or [t[0] for t in self._carry[:1]])
+        if sys.byteorder == "big":
+            hashes.byteswap()
+        raw = hashes.tobytes()
+        n = len(hashes)
+        value = 0
+        for j in range(8):
+            column = raw[j::8]
+            for b in range(8):
+                if 2 * column.translate(_BITS[b]).count(1) > n:
+                    value |= 1 << (8 * j + b)
+        return value
+
+
+def text_signature(texts: Iterable[str]) -> tuple[str, int]:
+    h = SimHash()
+    for text in texts:
+        h.update(text)
+    return h.hexdigest(), h.words
+
+
+def image_dhash(path: Path) -> str:
+    # Difference hash, one bit per horizontal gradient of a greyscale
+    # thumbnail. Survives rescaling, recompression and light re-scans. Text
+    # pages share their layout, so the usual 8x8 grid cannot tell two
+    # different pages apart; 32x32 (1024 bits) can.
+    from PIL import Image, ImageOps
+
+    n = _DHASH_SIZE
+    img = Image.open(path)
+    if img.format == "JPEG":
+        img.draft("L", (8 * n, 8 * n))
+    img = ImageOps.exif_transpose(img).convert("L").resize((n + 1, n), Image.LANCZOS)
+    px = img.tobytes()
+    value = 0
+    for row in range(n):
+        for col in range(n):
+            value = (value << 1) | (px[row * (n + 1) + col] > px[row * (n + 1) + col + 1])
+    return f"{value:0{n * n // 4}x}"
+
+
+def canonical_url(url: str) -> str:
+    # http/https, "www.", default ports, trailing slashes, fragments, tracking
+    # parameters and query order do not make a different page.
+    parts = urlsplit(url.strip())
+    scheme = parts.scheme.lower()
+    if scheme not in ("http", "https"):
+        return url.strip()
+    host = (parts.hostname or "").lower()
+    if host.startswith("www."):
+        host = host[4:]
+    if parts.port and parts.port not in (80, 443):
+        host = f"{host}:{parts.port}"
+    path = re.sub(r"/{2,}", "/", parts.path or "/")
+    if len(path) > 1:
+        path = path.rstrip("/")
+    query = sorted(
+        (k, v)
+        for k, v in parse_qsl(parts.query, keep_blank_values=True)
+        if not k.lower().startswith("utm_") and k.lower() not in _TRACKING_PARAMS
+    )
+    return urlunsplit(("https", host, path, urlencode(query), ""))
+
+
+def content_hash(text: str) -> str:
+    return hashlib.sha1(" ".join(_WORD.findall((text or "").casefold())).encode("utf-8")).hexdigest()
@@ -42,6 +42,7 @@ def send_email(
             )
 
     with smtplib.SMTP(settings.smtp_host, settings.smtp_port) as smtp:
-        smtp.starttls()
+        if settings.smtp_starttls:
+            smtp.starttls()
         smtp.login(settings.smtp_username, settings.smtp_password)
         smtp.send_message(msg)
@@ -1,32 +1,47 @@
 from __future__ import annotations
 
-from datetime import datetime
+from datetime import date, datetime
 from pathlib import Path
+import hashlib
 import random
 
-import genanki
-
 from .models import LessonBundle
 
 
-def save_lesson(output_dir: Path, lesson_md: str) -> Path:
+def save_lesson(output_dir: Path, lesson_md: str, day: date | None = None) -> Path:
     output_dir.mkdir(parents=True, exist_ok=True)
-    stamp = datetime.now().strftime("%Y-%m-%d")
+    stamp = (day or datetime.now()).strftime("%Y-%m-%d")
     out = output_dir / f"lesson-{stamp}.md"
     out.write_text(lesson_md, encoding="utf-8")
     return out
 
 
-def build_anki_deck(output_dir: Path, bundle: LessonBundle) -> Path:
+def _stable_id(name: str) -> int:
+    return 10**9 + int(hashlib.sha1(name.encode("utf-8")).hexdigest()[:8], 16) % (10**9)
+
+
+def build_anki_deck(
+    output_dir: Path,
+    bundle: LessonBundle,
+    day: date | None = None,
+    deck_name: str | None = None,
+    model_name: str = "DailyLessonModel",
+) -> Path:
+    import genanki
+
     output_dir.mkdir(parents=True, exist_ok=True)
-    stamp = datetime.now().strftime("%Y-%m-%d")
+    stamp = (day or datetime.now()).strftime("%Y-%m-%d")
 
-    model_id = random.randint(10**9, 2 * 10**9 - 1)
-    deck_id = random.randint(10**9, 2 * 10**9 - 1)
+    if deck_name:
+        # A named deck and note type keep their ids, so every import lands in the same deck.
+        model_id, deck_id = _stable_id(model_name), _stable_id(deck_name)
+    else:
+        model_id = random.randint(10**9, 2 * 10**9 - 1)
+        deck_id = random.randint(10**9, 2 * 10**9 - 1)
 
     model = genanki.Model(
         model_id,
-        "DailyLessonModel",
+        model_name,
         fields=[{"name": "Front"}, {"name": "Back"}],
         templates=[
             {
@@ -37,7 +52,7 @@ def build_anki_deck(output_dir: Path, bundle: LessonBundle) -> Path:
         ],
     )
 
-    deck = genanki.Deck(deck_id, f"MentorLoop {stamp}")
+    deck = genanki.Deck(deck_id, deck_name or f"MentorLoop {stamp}")
     for card in bundle.cards:
         front = (card.get("front") or "").strip()
         back = (card.get("back") or "").strip()
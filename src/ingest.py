@@ -1,18 +1,22 @@
 from __future__ import annotations
 
+from array import array
+from collections.abc import Iterable, Iterator
 from pathlib import Path
+from xml.etree import ElementTree
 import hashlib
+import mmap
+import os
 import re
+import zipfile
 
-import requests
-from bs4 import BeautifulSoup
-from docx import Document
-from PIL import Image
-import pytesseract
-from pypdf import PdfReader
-
+from .boilerplate import BoilerplateCache, build_profile, strip_boilerplate
 from .config import IngestionPrefs
+from .dedupe import canonical_url
 from .models import SourceUnit
+from .ocr import OcrCache, ocr_images
+from .pdf_text import PdfDocuments, get_pdf_backend
+from .transport import get_transport
 
 
 def file_fingerprint(path: Path) -> str:
@@ -26,46 +30,152 @@ def file_fingerprint(path: Path) -> str:
     return h.hexdigest()
 
 
-def split_words(text: str, chunk_words: int) -> list[str]:
-    words = text.split()
-    chunks = []
-    for i in range(0, len(words), chunk_words):
-        chunks.append(" ".join(words[i : i + chunk_words]))
-    return [c for c in chunks if c.strip()]
+def iter_word_chunks(texts: Iterable[str], chunk_words: int) -> Iterator[str]:
+    # Chunks of chunk_words words across all texts, without materialising the joined text.
+    buf: list[str] = []
+    for text in texts:
+        buf.extend(text.split())
+        while len(buf) >= chunk_words:
+            yield " ".join(buf[:chunk_words])
+            del buf[:chunk_words]
+    if buf:
+        yield " ".join(buf)
+
+
+def _chunk_pattern(chunk_words: int) -> re.Pattern[bytes]:
+    # One match per chunk: the regex engine walks the words instead of a Python loop.
+    return re.compile(rb"\S+(?:\s+\S+){0,%d}" % max(0, chunk_words - 1))
+
+
+def iter_text_chunk_spans(path: Path, chunk_words: int) -> Iterator[tuple[int, int]]:
+    with open(path, "rb") as f:
+        if os.fstat(f.fileno()).st_size == 0:
+            return
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+            for m in _chunk_pattern(chunk_words).finditer(mm):
+                yield m.start(), m.end()
+
+
+def _normalize_chunk(raw: bytes) -> str:
+    return b" ".join(raw.split()).decode("utf-8", errors="ignore")
+
+
+def iter_text_chunks(path: Path, chunk_words: int) -> Iterator[tuple[int, int, str]]:
+    with open(path, "rb") as f:
+        if os.fstat(f.fileno()).st_size == 0:
+            return
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+            for m in _chunk_pattern(chunk_words).finditer(mm):
+                yield m.start(), m.end(), _normalize_chunk(m.group())
 
 
-def read_pdf_units(path: Path) -> list[SourceUnit]:
-    reader = PdfReader(str(path))
-    units = []
-    for i, page in enumerate(reader.pages):
-        units.append(SourceUnit(unit_index=i, text=page.extract_text() or ""))
-    return units
+# Byte offsets of every chunk boundary in a TXT/MD file. Persisted as a sidecar
+# keyed by fingerprint so unit N is a single seek and counting never holds the file.
+class TextChunkIndex:
+    def __init__(self, spans: array) -> None:
+        self.spans = spans
 
+    def __len__(self) -> int:
+        return len(self.spans) // 2
 
-def read_docx_units(path: Path, chunk_words: int) -> list[SourceUnit]:
-    doc = Document(str(path))
-    text = "\n".join(p.text for p in doc.paragraphs)
-    return [
-        SourceUnit(unit_index=i, text=t)
-        for i, t in enumerate(split_words(text, chunk_words))
-    ]
+    def span(self, n: int) -> tuple[int, int]:
+        return self.spans[2 * n], self.spans[2 * n + 1]
 
+    def read(self, path: Path, n: int) -> str:
+        start, end = self.span(n)
+        with open(path, "rb") as f:
+            f.seek(start)
+            return _normalize_chunk(f.read(end - start))
 
-def read_text_units(path: Path, chunk_words: int) -> list[SourceUnit]:
-    text = path.read_text(encoding="utf-8", errors="ignore")
-    return [
-        SourceUnit(unit_index=i, text=t)
-        for i, t in enumerate(split_words(text, chunk_words))
-    ]
+    @classmethod
+    def build(cls, path: Path, chunk_words: int) -> "TextChunkIndex":
+        spans = array("Q")
+        for start, end in iter_text_chunk_spans(path, chunk_words):
+            spans.append(start)
+            spans.append(end)
+        return cls(spans)
 
+    @staticmethod
+    def sidecar_path(cache_dir: Path, fingerprint: str, chunk_words: int) -> Path:
+        return cache_dir / "text-index" / f"{fingerprint}-{chunk_words}.idx"
 
-def read_image_units(path: Path) -> list[SourceUnit]:
-    text = pytesseract.image_to_string(Image.open(path))
-    return [SourceUnit(unit_index=0, text=text)]
+    @classmethod
+    def load(cls, path: Path, fingerprint: str, chunk_words: int, cache_dir: Path) -> "TextChunkIndex":
+        sidecar = cls.sidecar_path(cache_dir, fingerprint, chunk_words)
+        if sidecar.exists():
+            spans = array("Q")
+            spans.frombytes(sidecar.read_bytes())
+            return cls(spans)
+        index = cls.build(path, chunk_words)
+        sidecar.parent.mkdir(parents=True, exist_ok=True)
+        tmp = sidecar.with_suffix(".tmp")
+        tmp.write_bytes(index.spans.tobytes())
+        os.replace(tmp, sidecar)
+        return index
 
 
-def fetch_url_text(url: str, timeout: int = 15) -> str:
-    resp = requests.get(url, timeout=timeout, headers={"User-Agent": "lesson-bot/1.0"})
+_W = "{http://schemas.openxmlformats.org/wordprocessingml/2006/main}"
+
+
+def _docx_paragraph_text(p: ElementTree.Element) -> str:
+    parts = []
+    for el in p.iter():
+        if el.tag == _W + "t" and el.text:
+            parts.append(el.text)
+        elif el.tag in (_W + "tab", _W + "br", _W + "cr"):
+            parts.append(" ")
+    return "".join(parts).strip()
+
+
+def iter_docx_blocks(path: Path) -> Iterator[str]:
+    # Paragraphs are yielded as they close; each table row is yielded as one
+    # "cell | cell" line so vocabulary pairs stay together. Elements are cleared
+    # as soon as they are consumed, so memory does not grow with document size.
+    with zipfile.ZipFile(path) as z, z.open("word/document.xml") as f:
+        body = None
+        rows: list[list[str]] = []
+        cells: list[list[str]] = []
+        for event, el in ElementTree.iterparse(f, events=("start", "end")):
+            tag = el.tag
+            if event == "start":
+                if tag == _W + "body":
+                    body = el
+                elif tag == _W + "tr":
+                    rows.append([])
+                elif tag == _W + "tc":
+                    cells.append([])
+                continue
+
+            if tag == _W + "p":
+                text = _docx_paragraph_text(el)
+                if cells:
+                    if text:
+                        cells[-1].append(text)
+                elif text:
+                    yield text
+                el.clear()
+            elif tag == _W + "tc" and cells:
+                cell = " ".join(cells.pop())
+                if rows and cell:
+                    rows[-1].append(cell)
+                el.clear()
+            elif tag == _W + "tr" and rows:
+                row = rows.pop()
+                if row:
+                    if cells:
+                        cells[-1].append(" | ".join(row))
+                    else:
+                        yield " | ".join(row)
+                el.clear()
+
+            if body is not None and not cells and tag in (_W + "p", _W + "tbl", _W + "sdt"):
+                body.clear()
+
+
+def fetch_url_text(url: str, timeout: int = 15, transport=None) -> str:
+    from bs4 import BeautifulSoup
+
+    resp = (transport or get_transport()).get(url, timeout=timeout)
     resp.raise_for_status()
     soup = BeautifulSoup(resp.text, "html.parser")
     for s in soup(["script", "style", "noscript"]):
@@ -88,21 +198,143 @@ def load_links(content_dir: Path) -> list[str]:
     if not links_file.exists():
         return []
     urls = []
+    seen = set()
     for line in links_file.read_text(encoding="utf-8", errors="ignore").splitlines():
         line = line.strip()
         if line and not line.startswith("#"):
-            urls.append(line)
+            # The same page under a tracking parameter, "www." or http:// is listed once.
+            key = canonical_url(line)
+            if key not in seen:
+                seen.add(key)
+                urls.append(line)
     return urls
 
 
-def read_units_for_file(path: Path, prefs: IngestionPrefs) -> list[SourceUnit]:
+def count_pdf_pages(path: Path) -> int:
+    # Only the xref and the page tree are read; no page content is parsed.
+    try:
+        import fitz
+
+        with fitz.open(str(path)) as doc:
+            return doc.page_count
+    except Exception:
+        from pypdf import PdfReader
+
+        reader = PdfReader(str(path))
+        try:
+            return int(reader.trailer["/Root"]["/Pages"]["/Count"])
+        except Exception:
+            return len(reader.pages)
+
+
+def count_docx_units(path: Path, chunk_words: int) -> int:
+    words = sum(len(block.split()) for block in iter_docx_blocks(path))
+    return -(-words // chunk_words)
+
+
+def count_units_for_file(path: Path, prefs: IngestionPrefs, fingerprint: str, cache_dir: Path) -> int:
+    ext = path.suffix.lower()
+    if ext == ".pdf":
+        return count_pdf_pages(path)
+    if ext == ".docx":
+        return count_docx_units(path, prefs.chunk_words)
+    if ext in {".txt", ".md"}:
+        return len(TextChunkIndex.load(path, fingerprint, prefs.chunk_words, cache_dir))
+    if ext in {".png", ".jpg", ".jpeg", ".webp"}:
+        return 1
+    return 0
+
+
+def pdf_boilerplate(path: Path, fingerprint: str, cache_dir: Path, backend, pages: list[str] | None = None) -> dict:
+    # Line statistics over every page, computed once per fingerprint.
+    cache = BoilerplateCache(cache_dir)
+    profile = cache.get(fingerprint)
+    if profile is None:
+        if pages is None:
+            pages = (backend.extract_pages(path, [i]).get(i, "") for i in range(backend.page_count(path)))
+        profile = build_profile(pages)
+        cache.put(fingerprint, profile)
+    return profile
+
+
+def read_units_at(
+    path: Path,
+    indexes: list[int],
+    prefs: IngestionPrefs,
+    fingerprint: str,
+    cache_dir: Path,
+    docs: PdfDocuments | None = None,
+) -> list[SourceUnit]:
+    wanted = sorted({i for i in indexes if i >= 0})
+    if not wanted:
+        return []
     ext = path.suffix.lower()
     if ext == ".pdf":
-        return read_pdf_units(path)
+        if docs is None:
+            with PdfDocuments() as own:
+                return read_units_at(path, wanted, prefs, fingerprint, cache_dir, docs=own)
+        backend = get_pdf_backend(prefs.pdf_backend, docs)
+        pages = backend.extract_pages(path, wanted)
+        if prefs.strip_boilerplate:
+            profile = pdf_boilerplate(path, fingerprint, cache_dir, backend)
+            pages = {i: strip_boilerplate(t, profile, i) for i, t in pages.items()}
+        return [SourceUnit(unit_index=i, text=pages[i]) for i in wanted if i in pages]
     if ext == ".docx":
-        return read_docx_units(path, prefs.chunk_words)
+        out = []
+        last = wanted[-1]
+        for i, text in enumerate(iter_word_chunks(iter_docx_blocks(path), prefs.chunk_words)):
+            if i in wanted:
+                out.append(SourceUnit(unit_index=i, text=text))
+            if i >= last:
+                break
+        return out
     if ext in {".txt", ".md"}:
-        return read_text_units(path, prefs.chunk_words)
+        index = TextChunkIndex.load(path, fingerprint, prefs.chunk_words, cache_dir)
+        return [SourceUnit(unit_index=i, text=index.read(path, i)) for i in wanted if i < len(index)]
     if ext in {".png", ".jpg", ".jpeg", ".webp"}:
-        return read_image_units(path)
+        text = ocr_images([(path, fingerprint)], cache_dir, prefs).get(fingerprint, "")
+        return [SourceUnit(unit_index=0, text=text)] if 0 in wanted else []
     return []
+
+
+def iter_all_units(
+    path: Path,
+    prefs: IngestionPrefs,
+    fingerprint: str,
+    cache_dir: Path,
+    docs: PdfDocuments | None = None,
+) -> Iterator[tuple[int, str]]:
+    # Every unit of a source, one at a time. Images only yield text that OCR has
+    # already cached; indexing never triggers OCR on its own.
+    ext = path.suffix.lower()
+    if ext == ".pdf":
+        if docs is None:
+            with PdfDocuments() as own:
+                yield from iter_all_units(path, prefs, fingerprint, cache_dir, docs=own)
+            return
+        backend = get_pdf_backend(prefs.pdf_backend, docs)
+        count = backend.page_count(path)
+        if not prefs.strip_boilerplate:
+            for i in range(count):
+                yield i, backend.extract_pages(path, [i]).get(i, "")
+            return
+        profile = BoilerplateCache(cache_dir).get(fingerprint)
+        if profile is None:
+            # First full pass over a new PDF (search indexing): build the
+            # boilerplate profile from the same page texts.
+            pages = [backend.extract_pages(path, [i]).get(i, "") for i in range(count)]
+            profile = pdf_boilerplate(path, fingerprint, cache_dir, backend, pages)
+            for i, text in enumerate(pages):
+                yield i, strip_boilerplate(text, profile, i)
+            return
+        for i in range(count):
+            yield i, strip_boilerplate(backend.extract_pages(path, [i]).get(i, ""), profile, i)
+    elif ext == ".docx":
+        yield from enumerate(iter_word_chunks(iter_docx_blocks(path), prefs.chunk_words))
+    elif ext in {".txt", ".md"}:
+        for i, (_, _, text) in enumerate(iter_text_chunks(path, prefs.chunk_words)):
+            yield i, text
+    elif ext in {".png", ".jpg", ".jpeg", ".webp"}:
+        text = OcrCache(cache_dir).get(fingerprint)
+        if text:
+            yield 0, text
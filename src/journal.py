@@ -0,0 +1,68 @@
+from __future__ import annotations
+
+from datetime import date, datetime
+from pathlib import Path
+import json
+import os
+from typing import Any
+
+
+class RunJournal:
+    # Per-day checkpoint of each pipeline stage's output. A rerun on the same day
+    # picks up after the last stage recorded here instead of starting over.
+    def __init__(self, path: Path, data: dict[str, Any]) -> None:
+        self.path = path
+        self.data = data
+
+    @classmethod
+    def open(cls, runs_dir: Path, day: date) -> "RunJournal":
+        path = runs_dir / f"{day.isoformat()}.json"
+        data: dict[str, Any] = {}
+        if path.exists():
+            try:
+                data = json.loads(path.read_text(encoding="utf-8"))
+            except (OSError, ValueError):
+                data = {}
+        if not data or data.get("completed_at"):
+            # Nothing to resume: a finished run on the same day starts a new one.
+            data = {"day": day.isoformat(), "started_at": datetime.now().isoformat(), "stages": {}}
+        return cls(path, data)
+
+    @property
+    def stages(self) -> dict[str, Any]:
+        return self.data.setdefault("stages", {})
+
+    def has(self, stage: str) -> bool:
+        return stage in self.stages
+
+    def get(self, stage: str, default: Any = None) -> Any:
+        return self.stages.get(stage, default)
+
+    def put(self, stage: str, value: Any) -> Any:
+        self.stages[stage] = value
+        self._save()
+        return value
+
+    def complete(self) -> None:
+        # A finished run is in the state history; its checkpoints (packets,
+        # lesson text) are not needed again. Journals of earlier days are never
+        # resumed either, so they go too.
+        day = self.data.get("day") or self.path.stem
+        for p in self.path.parent.glob("*.json"):
+            if p.stem <= day:
+                try:
+                    p.unlink()
+                except OSError:
+                    pass
+
+    def reset(self) -> None:
+        self.data = {"day": self.data.get("day"), "started_at": datetime.now().isoformat(), "stages": {}}
+        if self.path.exists():
+            self.path.unlink()
+
+    def _save(self) -> None:
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        tmp = self.path.with_suffix(".tmp")
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump(self.data, f, ensure_ascii=False, indent=2)
+        os.replace(tmp, self.path)
@@ -0,0 +1,212 @@
+from __future__ import annotations
+
+from datetime import datetime
+from pathlib import Path
+import threading
+import time
+
+from .config import BudgetPrefs
+
+
+class BudgetExceeded(RuntimeError):
+    pass
+
+
+def read_usage(response) -> tuple[int, int, int]:
+    # (input, output, cached input) from either a Responses or a Chat Completions usage block.
+    usage = getattr(response, "usage", None)
+    if usage is None:
+        return 0, 0, 0
+    inp = getattr(usage, "input_tokens", None)
+    if inp is None:
+        inp = getattr(usage, "prompt_tokens", 0)
+    out = getattr(usage, "output_tokens", None)
+    if out is None:
+        out = getattr(usage, "completion_tokens", 0)
+    details = getattr(usage, "input_tokens_details", None) or getattr(usage, "prompt_tokens_details", None)
+    cached = getattr(details, "cached_tokens", 0) if details is not None else 0
+    return int(inp or 0), int(out or 0), int(cached or 0)
+
+
+def price_for(prices: dict, model: str) -> dict:
+    # Dated snapshots ("gpt-4.1-mini-2025-04-14") use their family's price.
+    best = ""
+    for name in prices:
+        if (model == name or model.startswith(name + "-")) and len(name) > len(best):
+            best = name
+    return prices.get(best) or {}
+
+
+def call_cost(prices: dict, model: str, inp: int, out: int, cached: int) -> float:
+    p = price_for(prices, model)
+    uncached = max(0, inp - cached)
+    return (
+        uncached * float(p.get("input", 0))
+        + cached * float(p.get("cached_input", p.get("input", 0)))
+        + out * float(p.get("output", 0))
+    ) / 1_000_000
+
+
+class TokenLedger:
+    # Every model call, with its stage, model, token counts, cost and latency.
+    # Budgets are checked against what is already spent plus the estimated
+    # input of the next call, before that call is sent.
+    def __init__(self, db_path: Path, prefs: BudgetPrefs) -> None:
+        import sqlite3
+
+        db_path.parent.mkdir(parents=True, exist_ok=True)
+        self.prefs = prefs
+        self._lock = threading.Lock()
+        self.conn = sqlite3.connect(str(db_path), check_same_thread=False)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute(
+            "CREATE TABLE IF NOT EXISTS calls ("
+            "ts TEXT NOT NULL, day TEXT NOT NULL, month TEXT NOT NULL, stage TEXT NOT NULL, model TEXT NOT NULL, "
+            "input_tokens INTEGER NOT NULL, output_tokens INTEGER NOT NULL, cached_tokens INTEGER NOT NULL, "
+            "cost_usd REAL NOT NULL, latency_ms INTEGER NOT NULL, ok INTEGER NOT NULL)"
+        )
+        self.conn.execute("CREATE INDEX IF NOT EXISTS calls_day ON calls (day)")
+        self.conn.execute("CREATE INDEX IF NOT EXISTS calls_month ON calls (month)")
+        self.conn.commit()
+
+    def close(self) -> None:
+        self.conn.close()
+
+    def spent(self, column: str, value: str) -> tuple[int, float]:
+        with self._lock:
+            row = self.conn.execute(
+                f"SELECT COALESCE(SUM(input_tokens + output_tokens), 0), COALESCE(SUM(cost_usd), 0) "
+                f"FROM calls WHERE {column} = ?",
+                (value,),
+            ).fetchone()
+        return int(row[0]), float(row[1])
+
+    def check(self, model: str, estimated_input: int = 0) -> None:
+        now = datetime.now()
+        estimate_cost = call_cost(self.prefs.prices, model, estimated_input, 0, 0)
+        for label, column, value, max_tokens, max_usd in (
+            ("daily", "day", now.strftime("%Y-%m-%d"), self.prefs.daily_tokens, self.prefs.daily_usd),
+            ("monthly", "month", now.strftime("%Y-%m"), self.prefs.monthly_tokens, self.prefs.monthly_usd),
+        ):
+            if not max_tokens and not max_usd:
+                continue
+            tokens, usd = self.spent(column, value)
+            if max_tokens and tokens + estimated_input > max_tokens:
+                raise BudgetExceeded(
+                    f"{label} token budget: {tokens} used + ~{estimated_input} for this call > {max_tokens}"
+                )
+            if max_usd and usd + estimate_cost > max_usd:
+                raise BudgetExceeded(
+                    f"{label} cost budget: ${usd:.4f} used + ~${estimate_cost:.4f} for this call > ${max_usd:.2f}"
+                )
+
+    def record(
+        self, stage: str, model: str, inp: int, out: int, cached: int, latency_ms: int, ok: bool = True
+    ) -> None:
+        now = datetime.now()
+        cost = call_cost(self.prefs.prices, model, inp, out, cached)
+        with self._lock, self.conn:
+            self.conn.execute(
+                "INSERT INTO calls VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                (
+                    now.isoformat(timespec="seconds"),
+                    now.strftime("%Y-%m-%d"),
+                    now.strftime("%Y-%m"),
+                    stage,
+                    model,
+                    inp,
+                    out,
+                    cached,
+                    cost,
+                    latency_ms,
+                    int(ok),
+                ),
+            )
+
+    def call(self, stage: str, create, estimated_input: int = 0, **kwargs):
+        model = str(kwargs.get("model") or "")
+        self.check(model, estimated_input)
+        t0 = time.perf_counter()
+        try:
+            response = create(**kwargs)
+        except Exception:
+            try:
+                self.record(stage, model, 0, 0, 0, int((time.perf_counter() - t0) * 1000), ok=False)
+            except Exception:
+                pass
+            raise
+        try:
+            self.record(
+                stage,
+                str(getattr(response, "model", "") or model),
+                *read_usage(response),
+                int((time.perf_counter() - t0) * 1000),
+            )
+        except Exception:
+            pass
+        return response
+
+    def report(self, since_day: str, group_by: str = "day") -> list[dict]:
+        keys = {"day": "day, stage", "stage": "stage", "model": "model", "month": "month, stage"}[group_by]
+        with self._lock:
+            rows = self.conn.execute(
+                f"SELECT {keys}, COUNT(*), SUM(input_tokens), SUM(cached_tokens), SUM(output_tokens), "
+                f"SUM(cost_usd), AVG(latency_ms), SUM(1 - ok) "
+                f"FROM calls WHERE day >= ? GROUP BY {keys} ORDER BY {keys}",
+                (since_day,),
+            ).fetchall()
+        names = [k.strip() for k in keys.split(",")]
+        out = []
+        for row in rows:
+            n = len(names)
+            calls, inp, cached, outp, cost, latency, failed = row[n:]
+            out.append(
+                {
+                    **dict(zip(names, row[:n])),
+                    "calls": calls,
+                    "input_tokens": int(inp or 0),
+                    "cached_tokens": int(cached or 0),
+                    "output_tokens": int(outp or 0),
+                    "cost_usd": round(float(cost or 0), 4),
+                    "avg_latency_ms": int(latency or 0),
+                    "failed": int(failed or 0),
+                }
+            )
+        return out
+
+    def latencies(self, stage: str, model: str, limit: int = 50) -> list[int]:
+        # The model itself or its dated snapshots (gpt-4.1-2025-04-14), never a sibling like gpt-4.1-mini.
+        with self._lock:
+            rows = self.conn.execute(
+                "SELECT latency_ms FROM calls WHERE stage = ? AND (model = ? OR model GLOB ?) AND ok = 1 "
+                "ORDER BY rowid DESC LIMIT ?",
+                (stage, model, f"{model}-[0-9][0-9][0-9][0-9]-[0-9][0-9]-[0-9][0-9]", limit),
+            ).fetchall()
+        return [r[0] for r in rows]
+
+    def calls_today(self, stage: str) -> int:
+        with self._lock:
+            row = self.conn.execute(
+                "SELECT COUNT(*) FROM calls WHERE day = ? AND stage = ?",
+                (datetime.now().strftime("%Y-%m-%d"), stage),
+            ).fetchone()
+        return int(row[0])
+
+
+_LEDGERS: dict[str, TokenLedger] = {}
+_LEDGERS_LOCK = threading.Lock()
+
+
+def ledger_path(settings) -> Path:
+    return settings.state_file.parent / "ledger.sqlite"
+
+
+def get_ledger(settings) -> TokenLedger:
+    path = ledger_path(settings)
+    with _LEDGERS_LOCK:
+        ledger = _LEDGERS.get(str(path))
+        if ledger is None or not path.exists():
+            ledger = TokenLedger(path, settings.budget)
+            _LEDGERS[str(path)] = ledger
+        ledger.prefs = settings.budget
+        return ledger
@@ -18,12 +18,18 @@ class SourceMeta:
     fingerprint: str
     units: int
     next_unit: int = 0
+    size: int = 0
+    mtime_ns: int = 0
+    signature: str = ""
+    words: int = 0
+    canonical_id: str = ""
 
 
 @dataclass
 class LinkState:
     links: list[str] = field(default_factory=list)
     next_index: int = 0
+    seen: dict[str, str] = field(default_factory=dict)
 
 
 @dataclass
@@ -0,0 +1,130 @@
+from __future__ import annotations
+
+from pathlib import Path
+import os
+
+from .config import IngestionPrefs
+
+OCR_TARGET_DPI = 300
+
+
+def preprocess_image(path: Path, max_side: int):
+    from PIL import Image, ImageOps
+
+    img = Image.open(path)
+    w, h = img.size
+    dpi = float((img.info.get("dpi") or (0, 0))[0] or 0)
+    scale = OCR_TARGET_DPI / dpi if dpi else 1.0
+    scale = min(scale, max_side / max(w, h))
+    if img.format == "JPEG" and scale < 1:
+        # Let the JPEG decoder downscale (1/2, 1/4, 1/8) and drop chroma while decoding.
+        img.draft("L", (max(1, int(w * scale)), max(1, int(h * scale))))
+    if img.getexif().get(0x0112, 1) in (5, 6, 7, 8):
+        # Rotated by 90 degrees: the transposed image is h wide and w high.
+        w, h = h, w
+    img = ImageOps.exif_transpose(img).convert("L")
+    target = (max(1, int(w * scale)), max(1, int(h * scale)))
+    if abs(scale - 1.0) > 0.05 and img.size != target:
+        img = img.resize(target, Image.LANCZOS)
+    return img
+
+
+def ocr_image(path: str, max_side: int) -> str:
+    import pytesseract
+
+    img = preprocess_image(Path(path), max_side)
+    return pytesseract.image_to_string(img, config=f"--dpi {OCR_TARGET_DPI}")
+
+
+def ocr_pdf_page(path: str, page_index: int, max_side: int) -> str:
+    import fitz
+    import pytesseract
+    from PIL import Image
+
+    with fitz.open(path) as doc:
+        page = doc[page_index]
+        zoom = min(OCR_TARGET_DPI / 72, max_side / max(page.rect.width, page.rect.height))
+        pix = page.get_pixmap(matrix=fitz.Matrix(zoom, zoom), colorspace=fitz.csGRAY, alpha=False)
+        img = Image.frombytes("L", [pix.width, pix.height], pix.samples)
+    return pytesseract.image_to_string(img, config=f"--dpi {OCR_TARGET_DPI}")
+
+
+class OcrCache:
+    def __init__(self, cache_dir: Path) -> None:
+        self.dir = cache_dir / "ocr"
+
+    def get(self, fingerprint: str) -> str | None:
+        p = self.dir / f"{fingerprint}.txt"
+        if not p.exists():
+            return None
+        return p.read_text(encoding="utf-8")
+
+    def put(self, fingerprint: str, text: str) -> None:
+        self.dir.mkdir(parents=True, exist_ok=True)
+        tmp = self.dir / f"{fingerprint}.tmp"
+        tmp.write_text(text, encoding="utf-8")
+        os.replace(tmp, self.dir / f"{fingerprint}.txt")
+
+
+def _run_cached(jobs: dict[str, tuple], cache_dir: Path, prefs: IngestionPrefs) -> dict[str, str]:
+    # jobs maps a cache key to (fn, *args); misses run in up to ocr_workers processes.
+    cache = OcrCache(cache_dir)
+    out: dict[str, str] = {}
+    todo: dict[str, tuple] = {}
+    for key, job in jobs.items():
+        cached = cache.get(key)
+        if cached is not None:
+            out[key] = cached
+        else:
+            todo[key] = job
+    if not todo:
+        return out
+
+    results: dict[str, str | None] = {}
+    workers = max(1, min(prefs.ocr_workers, len(todo)))
+    if workers == 1:
+        for key, (fn, *args) in todo.items():
+            try:
+                results[key] = fn(*args)
+            except Exception:
+                results[key] = None
+    else:
+        from concurrent.futures import ProcessPoolExecutor
+        import multiprocessing
+
+        # serve calls this from a threaded process (HTTP server, watcher,
+        # scheduler); a forked child could inherit a lock some other thread
+        # held, so workers start fresh interpreters instead.
+        with ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context("spawn")) as pool:
+            futures = {key: pool.submit(fn, *args) for key, (fn, *args) in todo.items()}
+            for key, fut in futures.items():
+                try:
+                    results[key] = fut.result()
+                except Exception:
+                    results[key] = None
+
+    for key, text in results.items():
+        # Failures (e.g. no Tesseract binary) are not cached so they are retried next run.
+        if text is None:
+            out[key] = ""
+            continue
+        cache.put(key, text)
+        out[key] = text
+    return out
+
+
+def ocr_images(jobs: list[tuple[Path, str]], cache_dir: Path, prefs: IngestionPrefs) -> dict[str, str]:
+    return _run_cached(
+        {fingerprint: (ocr_image, str(path), prefs.ocr_max_side) for path, fingerprint in jobs},
+        cache_dir,
+        prefs,
+    )
+
+
+def ocr_pdf_pages(jobs: list[tuple[Path, str, int]], cache_dir: Path, prefs: IngestionPrefs) -> dict[tuple[str, int], str]:
+    texts = _run_cached(
+        {f"{fingerprint}-p{idx}": (ocr_pdf_page, str(path), idx, prefs.ocr_max_side) for path, fingerprint, idx in jobs},
+        cache_dir,
+        prefs,
+    )
+    return {(fingerprint, idx): texts.get(f"{fingerprint}-p{idx}", "") for _, fingerprint, idx in jobs}
@@ -0,0 +1,105 @@
+from __future__ import annotations
+
+from pathlib import Path
+
+
+class PdfDocuments:
+    # PyMuPDF documents opened once per run and shared by text extraction and
+    # the vision renderer, instead of each re-opening and re-parsing the file.
+    def __init__(self) -> None:
+        self._docs: dict[str, object] = {}
+
+    def get(self, path: Path):
+        import fitz
+
+        key = str(Path(path).resolve())
+        doc = self._docs.get(key)
+        if doc is None:
+            doc = fitz.open(key)
+            self._docs[key] = doc
+        return doc
+
+    def close(self) -> None:
+        for doc in self._docs.values():
+            try:
+                doc.close()
+            except Exception:
+                pass
+        self._docs.clear()
+
+    def __enter__(self) -> "PdfDocuments":
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self.close()
+
+
+class PypdfBackend:
+    name = "pypdf"
+
+    def __init__(self, docs: PdfDocuments | None = None) -> None:
+        self._readers: dict[str, object] = {}
+
+    def close(self) -> None:
+        self._readers.clear()
+
+    def __enter__(self) -> "PypdfBackend":
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self.close()
+
+    def _reader(self, path: Path):
+        from pypdf import PdfReader
+
+        key = str(Path(path).resolve())
+        if key not in self._readers:
+            self._readers[key] = PdfReader(key)
+        return self._readers[key]
+
+    def page_count(self, path: Path) -> int:
+        return len(self._reader(path).pages)
+
+    def extract_pages(self, path: Path, indexes: list[int]) -> dict[int, str]:
+        reader = self._reader(path)
+        pages = len(reader.pages)
+        return {i: reader.pages[i].extract_text() or "" for i in indexes if 0 <= i < pages}
+
+
+class PyMuPDFBackend:
+    name = "pymupdf"
+
+    def __init__(self, docs: PdfDocuments | None = None) -> None:
+        # Documents passed in belong to the caller; only our own are closed here.
+        self._owns_docs = docs is None
+        self.docs = docs if docs is not None else PdfDocuments()
+
+    def close(self) -> None:
+        if self._owns_docs:
+            self.docs.close()
+
+    def __enter__(self) -> "PyMuPDFBackend":
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self.close()
+
+    def page_count(self, path: Path) -> int:
+        return self.docs.get(path).page_count
+
+    def extract_pages(self, path: Path, indexes: list[int]) -> dict[int, str]:
+        doc = self.docs.get(path)
+        return {i: doc[i].get_text("text") or "" for i in indexes if 0 <= i < doc.page_count}
+
+
+PDF_BACKENDS = {
+    PypdfBackend.name: PypdfBackend,
+    PyMuPDFBackend.name: PyMuPDFBackend,
+}
+
+
+def get_pdf_backend(name: str, docs: PdfDocuments | None = None):
+    try:
+        return PDF_BACKENDS[name.lower()](docs)
+    except KeyError:
+        raise ValueError(f"Unknown pdf_backend {name!r}; expected one of {sorted(PDF_BACKENDS)}") from None
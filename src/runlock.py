@@ -0,0 +1,124 @@
+from __future__ import annotations
+
+from datetime import datetime
+from pathlib import Path
+import json
+import os
+import socket
+import time
+import uuid
+
+
+class RunInProgress(RuntimeError):
+    def __init__(self, holder: dict | None) -> None:
+        self.holder = holder or {}
+        since = self.holder.get("started_at", "?")
+        super().__init__(
+            f"another run is in progress (pid {self.holder.get('pid', '?')}, "
+            f"{self.holder.get('command', 'run')} since {since})"
+        )
+
+
+def _try_lock(fd: int) -> bool:
+    try:
+        import fcntl
+    except ImportError:
+        import msvcrt
+
+        try:
+            os.lseek(fd, 0, os.SEEK_SET)
+            msvcrt.locking(fd, msvcrt.LK_NBLCK, 1)
+        except OSError:
+            return False
+        return True
+    try:
+        fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+    except BlockingIOError:
+        return False
+    return True
+
+
+def _unlock(fd: int) -> None:
+    try:
+        import fcntl
+    except ImportError:
+        import msvcrt
+
+        os.lseek(fd, 0, os.SEEK_SET)
+        msvcrt.locking(fd, msvcrt.LK_UNLCK, 1)
+        return
+    fcntl.flock(fd, fcntl.LOCK_UN)
+
+
+class RunLock:
+    # One writer of state.json across processes: serve's scheduled runs,
+    # `run-once --local`, `batch` and background syncs. The OS lock (flock,
+    # or msvcrt on Windows) dies with its process, so a crashed run never
+    # blocks the next one. The owner file beside it says who holds the lock;
+    # finding one while acquiring means its holder died mid-run, and it is
+    # reported as recovered and replaced.
+    def __init__(self, path: Path, command: str = "run") -> None:
+        self.path = path
+        self.owner_path = path.with_name(path.stem + ".owner.json")
+        self.command = command
+        self.run_id = uuid.uuid4().hex[:12]
+        self._fd: int | None = None
+        self.recovered: dict | None = None
+
+    def holder(self) -> dict | None:
+        try:
+            return json.loads(self.owner_path.read_text(encoding="utf-8"))
+        except (OSError, ValueError):
+            return None
+
+    def acquire(self, timeout: float | None = 0, poll: float = 0.5) -> bool:
+        # timeout 0: one attempt; None: wait as long as it takes.
+        if self._fd is not None:
+            return True
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        fd = os.open(self.path, os.O_RDWR | os.O_CREAT, 0o644)
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while not _try_lock(fd):
+            if deadline is not None and time.monotonic() >= deadline:
+                os.close(fd)
+                return False
+            time.sleep(poll if deadline is None else max(0.0, min(poll, deadline - time.monotonic())))
+        self._fd = fd
+        self.recovered = self.holder()
+        self._write_owner()
+        return True
+
+    def _write_owner(self) -> None:
+        tmp = self.owner_path.with_suffix(".tmp")
+        tmp.write_text(
+            json.dumps(
+                {
+                    "pid": os.getpid(),
+                    "host": socket.gethostname(),
+                    "command": self.command,
+                    "run_id": self.run_id,
+                    "started_at": datetime.now().isoformat(timespec="seconds"),
+                }
+            ),
+            encoding="utf-8",
+        )
+        os.replace(tmp, self.owner_path)
+
+    def release(self) -> None:
+        if self._fd is None:
+            return
+        try:
+            self.owner_path.unlink()
+        except OSError:
+            pass
+        try:
+            _unlock(self._fd)
+        finally:
+            os.close(self._fd)
+            self._fd = None
+
+    def __enter__(self) -> "RunLock":
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self.release()
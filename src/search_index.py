@@ -0,0 +1,95 @@
+from __future__ import annotations
+
+from collections.abc import Iterable
+from pathlib import Path
+import re
+import sqlite3
+
+_TERM = re.compile(r"\w{3,}", re.UNICODE)
+
+
+def build_match_query(text: str, max_terms: int = 16) -> str:
+    terms: list[str] = []
+    for t in _TERM.findall(text.lower()):
+        if t not in terms:
+            terms.append(t)
+        if len(terms) >= max_terms:
+            break
+    return " OR ".join(f'"{t}"' for t in terms)
+
+
+class UnitIndex:
+    # BM25 full-text index (SQLite FTS5) over every extracted unit, keyed by the
+    # source fingerprint so only new or changed sources are re-indexed.
+    def __init__(self, db_path: Path) -> None:
+        db_path.parent.mkdir(parents=True, exist_ok=True)
+        self.conn = sqlite3.connect(str(db_path), check_same_thread=False)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute(
+            "CREATE TABLE IF NOT EXISTS indexed_sources ("
+            "source_id TEXT PRIMARY KEY, fingerprint TEXT NOT NULL, path TEXT NOT NULL)"
+        )
+        self.conn.execute(
+            "CREATE VIRTUAL TABLE IF NOT EXISTS units USING fts5("
+            "text, source_id UNINDEXED, unit_index UNINDEXED, path UNINDEXED, "
+            "tokenize = 'unicode61 remove_diacritics 2')"
+        )
+        self.conn.commit()
+
+    def close(self) -> None:
+        self.conn.close()
+
+    def __enter__(self) -> "UnitIndex":
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self.close()
+
+    def is_current(self, source_id: str, fingerprint: str) -> bool:
+        row = self.conn.execute(
+            "SELECT fingerprint FROM indexed_sources WHERE source_id = ?", (source_id,)
+        ).fetchone()
+        return bool(row and row[0] == fingerprint)
+
+    def replace_source(self, source_id: str, fingerprint: str, path: str, units: Iterable[tuple[int, str]]) -> int:
+        count = 0
+        with self.conn:
+            self.conn.execute("DELETE FROM units WHERE source_id = ?", (source_id,))
+            for unit_index, text in units:
+                if not text or not text.strip():
+                    continue
+                self.conn.execute(
+                    "INSERT INTO units (text, source_id, unit_index, path) VALUES (?, ?, ?, ?)",
+                    (text, source_id, unit_index, path),
+                )
+                count += 1
+            self.conn.execute(
+                "INSERT OR REPLACE INTO indexed_sources (source_id, fingerprint, path) VALUES (?, ?, ?)",
+                (source_id, fingerprint, path),
+            )
+        return count
+
+    def retain(self, source_ids: set[str]) -> None:
+        stale = [
+            sid for (sid,) in self.conn.execute("SELECT source_id FROM indexed_sources")
+            if sid not in source_ids
+        ]
+        with self.conn:
+            for sid in stale:
+                self.conn.execute("DELETE FROM units WHERE source_id = ?", (sid,))
+                self.conn.execute("DELETE FROM indexed_sources WHERE source_id = ?", (sid,))
+
+    def search(self, query: str, limit: int = 5, snippet_tokens: int = 48) -> list[dict]:
+        match = build_match_query(query)
+        if not match:
+            return []
+        rows = self.conn.execute(
+            "SELECT source_id, path, unit_index, bm25(units) AS score, "
+            "snippet(units, 0, '', '', ' ... ', ?) "
+            "FROM units WHERE units MATCH ? ORDER BY score LIMIT ?",
+            (snippet_tokens, match, limit),
+        ).fetchall()
+        return [
+            {"source_id": sid, "path": path, "unit_index": int(idx), "score": round(-score, 4), "text": text}
+            for sid, path, idx, score, text in rows
+        ]
@@ -0,0 +1,65 @@
+from __future__ import annotations
+
+from pathlib import Path
+import json
+
+from .daemon import _pid_alive
+
+# `status` only reads state.json and the run lock's owner file. It does not
+# import the pipeline, parse the full config or touch the lock itself, so it
+# starts in about the time of a bare interpreter.
+
+
+def _config_value(key: str, default: str, config_path: str = "config.yaml") -> str:
+    # One top-level scalar of config.yaml, without loading yaml or .env.
+    config_file = Path(config_path)
+    if not config_file.exists():
+        config_file = Path(__file__).resolve().parent.parent / config_path
+    try:
+        lines = config_file.read_text(encoding="utf-8").splitlines()
+    except OSError:
+        return default
+    for line in lines:
+        if line.startswith(f"{key}:"):
+            value = line.split(":", 1)[1].split(" #", 1)[0].strip().strip("'\"")
+            return value or default
+    return default
+
+
+def status() -> None:
+    state_file = Path(_config_value("state_file", "state/state.json"))
+    try:
+        data = json.loads(state_file.read_text(encoding="utf-8"))
+    except (OSError, ValueError):
+        data = {}
+    sources = data.get("sources") or {}
+    links = data.get("link_state") or {}
+    history = data.get("history") or []
+
+    print(f"state: {state_file}")
+    if not sources:
+        print("no indexed sources yet (run `run-once` to index content/)")
+    total_remaining = 0
+    for sid in sorted(sources):
+        meta = sources[sid]
+        canonical = sources.get(meta.get("canonical_id") or "")
+        if canonical is not None:
+            print(f"  {meta['source_type']:<6} duplicate of {canonical['path']}: {meta['path']}")
+            continue
+        next_unit, units = meta.get("next_unit", 0), meta.get("units", 0)
+        remaining = max(0, units - next_unit)
+        total_remaining += remaining
+        print(f"  {meta['source_type']:<6} {next_unit:>6}/{units:<6} remaining={remaining:<6} {meta['path']}")
+    try:
+        holder = json.loads((state_file.parent / "run.owner.json").read_text(encoding="utf-8"))
+    except (OSError, ValueError):
+        holder = None
+    # The owner file outlives a crashed holder; only a live pid means a run.
+    if holder and int(holder.get("pid") or 0) > 0 and _pid_alive(int(holder["pid"])):
+        print(f"run in progress: {holder.get('command', '?')} pid {holder.get('pid', '?')} since {holder.get('started_at', '?')}")
+    total_links, next_index = len(links.get("links") or []), links.get("next_index", 0)
+    print(f"links: {next_index}/{total_links} remaining={max(0, total_links - next_index)}")
+    print(f"units remaining: {total_remaining}")
+    if history:
+        last = history[-1]
+        print(f"last run: {last.get('ts')} units={sum(last.get('sources_used', {}).values())} links={last.get('links_used', 0)}")
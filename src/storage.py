@@ -3,6 +3,7 @@ from __future__ import annotations
 from dataclasses import asdict
 from pathlib import Path
 import json
+import os
 
 from .models import AppState, LinkState, SourceMeta
 
@@ -19,6 +20,17 @@ def load_state(path: Path) -> AppState:
     return AppState(sources=sources, link_state=link_state, history=history)
 
 
+def refresh_state(path: Path, state: AppState | None = None) -> AppState:
+    # Re-read state.json into `state` in place, so a resident copy picks up
+    # cursors another process has saved.
+    if state is None:
+        return load_state(path)
+    if path.exists():
+        fresh = load_state(path)
+        state.sources, state.link_state, state.history = fresh.sources, fresh.link_state, fresh.history
+    return state
+
+
 def save_state(path: Path, state: AppState) -> None:
     path.parent.mkdir(parents=True, exist_ok=True)
     payload = {
@@ -26,5 +38,7 @@ def save_state(path: Path, state: AppState) -> None:
         "link_state": asdict(state.link_state),
         "history": state.history,
     }
-    with open(path, "w", encoding="utf-8") as f:
+    tmp = path.with_suffix(".tmp")
+    with open(tmp, "w", encoding="utf-8") as f:
         json.dump(payload, f, ensure_ascii=False, indent=2)
+    os.replace(tmp, path)
@@ -0,0 +1,198 @@
+from __future__ import annotations
+
+from urllib.parse import urlsplit
+import threading
+import time
+
+from .config import HttpPrefs
+
+
+class TransportMetrics:
+    def __init__(self) -> None:
+        self._lock = threading.Lock()
+        self.hosts: dict[str, dict[str, int]] = {}
+        self._streams: dict[str, set[int]] = {}
+
+    def record(self, host: str, sent: int, received: int, elapsed_ms: int, stream: int | None = None) -> None:
+        with self._lock:
+            row = self.hosts.setdefault(host, {"requests": 0, "bytes_sent": 0, "bytes_received": 0, "elapsed_ms": 0})
+            row["requests"] += 1
+            row["bytes_sent"] += sent
+            row["bytes_received"] += received
+            row["elapsed_ms"] += elapsed_ms
+            if stream is not None:
+                self._streams.setdefault(host, set()).add(stream)
+
+    def snapshot(self, pooled_connections: dict[str, int] | None = None) -> dict[str, dict[str, int]]:
+        # connections = sockets opened: distinct httpx streams plus what the
+        # requests pools report.
+        pooled_connections = pooled_connections or {}
+        with self._lock:
+            return {
+                host: {
+                    **row,
+                    "connections": len(self._streams.get(host, ())) + pooled_connections.get(host, 0),
+                }
+                for host, row in self.hosts.items()
+            }
+
+
+def metrics_delta(before: dict, after: dict) -> dict[str, dict[str, int]]:
+    out = {}
+    for host, row in after.items():
+        prev = before.get(host) or {}
+        delta = {k: v - prev.get(k, 0) for k, v in row.items()}
+        if delta.get("requests"):
+            out[host] = delta
+    return out
+
+
+class Transport:
+    # Process-wide HTTP layer: one keep-alive requests.Session for AnkiConnect
+    # and links, and one OpenAI client per (key, base_url) on a shared httpx
+    # pool, all with the same timeouts and per-host connection limits.
+    def __init__(self, prefs: HttpPrefs) -> None:
+        self.prefs = prefs
+        self.metrics = TransportMetrics()
+        self._lock = threading.Lock()
+        self._session = None
+        self._openai: dict[tuple[str, str], object] = {}
+
+    @property
+    def session(self):
+        with self._lock:
+            if self._session is None:
+                self._session = self._build_session()
+            return self._session
+
+    def _build_session(self):
+        import requests
+        from requests.adapters import HTTPAdapter
+
+        session = requests.Session()
+        adapter = HTTPAdapter(
+            pool_connections=self.prefs.max_hosts,
+            pool_maxsize=self.prefs.max_connections_per_host,
+            pool_block=True,
+        )
+        session.mount("http://", adapter)
+        session.mount("https://", adapter)
+        session.headers["User-Agent"] = "lesson-bot/1.0"
+        session.hooks["response"].append(self._on_requests_response)
+        return session
+
+    def _on_requests_response(self, resp, *args, **kwargs):
+        body = resp.request.body or b""
+        self.metrics.record(
+            urlsplit(resp.url).netloc,
+            len(body),
+            len(resp.content),
+            int(resp.elapsed.total_seconds() * 1000),
+        )
+        return resp
+
+    def request(self, method: str, url: str, timeout: float | None = None, **kwargs):
+        read = timeout if timeout is not None else self.prefs.read_timeout
+        return self.session.request(method, url, timeout=(self.prefs.connect_timeout, read), **kwargs)
+
+    def get(self, url: str, **kwargs):
+        return self.request("GET", url, **kwargs)
+
+    def post(self, url: str, **kwargs):
+        return self.request("POST", url, **kwargs)
+
+    def openai(self, api_key: str, base_url: str | None = None):
+        key = (api_key, base_url or "")
+        with self._lock:
+            client = self._openai.get(key)
+            if client is None:
+                from openai import OpenAI
+
+                client = OpenAI(api_key=api_key, base_url=base_url or None, http_client=self._build_httpx())
+                self._openai[key] = client
+            return client
+
+    def _build_httpx(self):
+        from openai import DEFAULT_CONNECTION_LIMITS, DefaultHttpxClient, Timeout
+
+        # openai's own Limits class, whichever httpx build it ships with.
+        limits = type(DEFAULT_CONNECTION_LIMITS)(
+            max_connections=self.prefs.max_connections_per_host,
+            max_keepalive_connections=self.prefs.max_connections_per_host,
+        )
+        metrics = self.metrics
+
+        def on_request(request) -> None:
+            request.extensions["started"] = time.perf_counter()
+
+        def record(response) -> None:
+            request = response.request
+            started = request.extensions.get("started") or time.perf_counter()
+            stream = response.extensions.get("network_stream")
+            metrics.record(
+                request.url.netloc.decode("ascii", "ignore"),
+                len(request.content or b""),
+                response.num_bytes_downloaded,
+                int((time.perf_counter() - started) * 1000),
+                id(stream) if stream is not None else None,
+            )
+
+        def on_response(response) -> None:
+            # SSE bodies are left to the caller, who reads them event by event
+            # and may close them early; they are counted once closed.
+            if response.headers.get("content-type", "").startswith("text/event-stream"):
+                stream = response.stream
+                close = stream.close
+
+                def close_and_record() -> None:
+                    try:
+                        close()
+                    finally:
+                        record(response)
+
+                stream.close = close_and_record
+                return
+            response.read()
+            record(response)
+
+        return DefaultHttpxClient(
+            limits=limits,
+            timeout=Timeout(self.prefs.openai_timeout, connect=self.prefs.connect_timeout),
+            event_hooks={"request": [on_request], "response": [on_response]},
+        )
+
+    def snapshot(self) -> dict[str, dict[str, int]]:
+        pooled: dict[str, int] = {}
+        if self._session is not None:
+            for adapter in set(self._session.adapters.values()):
+                pools = adapter.poolmanager.pools
+                for key in list(pools.keys()):
+                    pool = pools.get(key)
+                    if pool is not None:
+                        host = pool.host if pool.port in (None, 80, 443) else f"{pool.host}:{pool.port}"
+                        pooled[host] = pooled.get(host, 0) + pool.num_connections
+        return self.metrics.snapshot(pooled)
+
+    def close(self) -> None:
+        with self._lock:
+            if self._session is not None:
+                self._session.close()
+                self._session = None
+            for client in self._openai.values():
+                try:
+                    client.close()
+                except Exception:
+                    pass
+            self._openai.clear()
+
+
+_TRANSPORT: Transport | None = None
+_TRANSPORT_LOCK = threading.Lock()
+
+
+def get_transport(prefs: HttpPrefs | None = None) -> Transport:
+    global _TRANSPORT
+    with _TRANSPORT_LOCK:
+        if _TRANSPORT is None:
+            _TRANSPORT = Transport(prefs or HttpPrefs())
+        return _TRANSPORT
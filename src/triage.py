@@ -0,0 +1,100 @@
+from __future__ import annotations
+
+from dataclasses import dataclass
+from pathlib import Path
+
+from .config import OpenAIPrefs
+from .pdf_text import PdfDocuments
+
+ROUTE_VISION = "vision"
+ROUTE_OCR = "ocr"
+ROUTE_TEXT = "text"
+
+
+@dataclass
+class PageProfile:
+    page_index: int
+    text_chars: int
+    image_coverage: float
+    drawing_coverage: float
+    route: str
+
+    @property
+    def visual_score(self) -> float:
+        # Diagrams/tables drawn as vectors are what text extraction loses most,
+        # so drawings weigh more than embedded photos.
+        return self.image_coverage + 1.5 * self.drawing_coverage
+
+
+def _rect_area(r, page_rect) -> float:
+    r = r & page_rect
+    if r.is_empty:
+        return 0.0
+    return r.width * r.height
+
+
+def profile_page(page, page_index: int, prefs: OpenAIPrefs) -> PageProfile:
+    import fitz
+
+    page_rect = page.rect
+    area = max(1.0, page_rect.width * page_rect.height)
+    text_chars = len((page.get_text("text") or "").strip())
+
+    image_area = 0.0
+    for info in page.get_image_info():
+        image_area += _rect_area(fitz.Rect(info["bbox"]), page_rect)
+    drawing_area = 0.0
+    for path in page.get_drawings():
+        r = path.get("rect")
+        # Hairlines (rules, underlines, table borders) have no area; count them as thin strips.
+        if r is not None:
+            drawing_area += max(_rect_area(r, page_rect), (r.width + r.height) * 2)
+    image_coverage = min(1.0, image_area / area)
+    drawing_coverage = min(1.0, drawing_area / area)
+
+    if text_chars < prefs.vision_min_text_chars:
+        # No text layer: a scan or photo of a page needs OCR; a blank page needs nothing.
+        route = ROUTE_OCR if image_coverage >= 0.3 else ROUTE_TEXT
+    elif image_coverage + drawing_coverage >= prefs.vision_min_visual_coverage:
+        route = ROUTE_VISION
+    else:
+        route = ROUTE_TEXT
+    return PageProfile(page_index, text_chars, image_coverage, drawing_coverage, route)
+
+
+def triage_pdf_pages(
+    candidates: list[tuple[str, Path, int]],
+    docs: PdfDocuments,
+    prefs: OpenAIPrefs,
+    vision_budget: int,
+) -> dict[tuple[str, int], str]:
+    # Visually rich pages are ranked by coverage and the top `vision_budget` go to
+    # vision; the rest fall back to their text. Pages without a text layer go to
+    # OCR unless vision budget is left once the visual pages are served.
+    profiles: list[tuple[str, PageProfile]] = []
+    for sid, path, idx in candidates:
+        try:
+            doc = docs.get(path)
+            if not 0 <= idx < doc.page_count:
+                continue
+            profiles.append((sid, profile_page(doc[idx], idx, prefs)))
+        except Exception:
+            continue
+
+    routes = {(sid, p.page_index): ROUTE_TEXT for sid, p in profiles}
+    visual = sorted(
+        (x for x in profiles if x[1].route == ROUTE_VISION),
+        key=lambda x: x[1].visual_score,
+        reverse=True,
+    )
+    for sid, p in visual[:vision_budget]:
+        routes[(sid, p.page_index)] = ROUTE_VISION
+    spare = max(0, vision_budget - len(visual))
+    for sid, p in profiles:
+        if p.route == ROUTE_OCR:
+            if spare > 0:
+                routes[(sid, p.page_index)] = ROUTE_VISION
+                spare -= 1
+            else:
+                routes[(sid, p.page_index)] = ROUTE_OCR
+    return routes
@@ -1,62 +1,120 @@
 from __future__ import annotations
 
 import base64
+import json
+import math
+from dataclasses import dataclass
 from io import BytesIO
 from pathlib import Path
 
-import fitz
-from PIL import Image
-from openai import OpenAI
-
 from .config import Settings
+from .ledger import get_ledger
+from .pdf_text import PdfDocuments
+from .transport import Transport, get_transport
+
+SYSTEM_PROMPT = "You extract learning-relevant visual details from study material."
+ANALYSIS_PROMPT = (
+    "Analyze this study page/image. Extract key ideas, definitions, formulas, "
+    "table/chart findings, and diagram relationships. Keep it concise and factual."
+)
+BATCH_PROMPT = (
+    "Each of the following study pages/images is preceded by its key. For every image, extract key "
+    "ideas, definitions, formulas, table/chart findings, and diagram relationships. Keep each analysis "
+    'concise and factual. Return JSON only: {"pages": [{"key": "<key>", "analysis": "<text>"}]}, '
+    "with exactly one entry per key."
+)
+# Rough budget for the fixed prompt and the per-image key label.
+BATCH_PROMPT_TOKENS = 120
+BATCH_LABEL_TOKENS = 10
+
+
+@dataclass
+class VisionImage:
+    key: str
+    b64: str
+    tokens: int
+
+
+def estimate_image_tokens(width: int, height: int) -> int:
+    # OpenAI high-detail accounting: fit in 2048x2048, shortest side to 768, 170 per 512px tile + 85.
+    scale = min(1.0, 2048 / max(width, height))
+    w, h = width * scale, height * scale
+    scale = min(1.0, 768 / min(w, h))
+    w, h = w * scale, h * scale
+    return 85 + 170 * math.ceil(w / 512) * math.ceil(h / 512)
+
+
+def _encode_jpeg(img) -> tuple[str, int]:
+    if max(img.size) > 1800:
+        img.thumbnail((1800, 1800))
+    buf = BytesIO()
+    img.save(buf, format="JPEG", quality=85, optimize=True)
+    return base64.b64encode(buf.getvalue()).decode("ascii"), estimate_image_tokens(*img.size)
 
 
 class VisionExtractor:
-    def __init__(self, settings: Settings) -> None:
-        self.client = OpenAI(api_key=settings.openai_api_key)
+    def __init__(
+        self, settings: Settings, docs: PdfDocuments | None = None, transport: Transport | None = None
+    ) -> None:
+        transport = transport or get_transport(settings.http)
+        self.client = transport.openai(settings.openai_api_key, settings.openai_base_url)
+        self.ledger = get_ledger(settings)
         self.model = settings.openai_vision_model
+        # Documents passed in belong to the caller; only our own are closed here.
+        self._owns_docs = docs is None
+        self.docs = docs if docs is not None else PdfDocuments()
+        self.batch_max_images = max(1, settings.openai.vision_batch_max_images)
+        self.batch_max_tokens = settings.openai.vision_batch_max_tokens
+
+    def close(self) -> None:
+        if self._owns_docs:
+            self.docs.close()
+
+    def __enter__(self) -> "VisionExtractor":
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self.close()
 
-    @staticmethod
-    def _render_pdf_page_jpeg_b64(pdf_path: Path, page_index: int) -> str:
-        with fitz.open(str(pdf_path)) as doc:
-            if page_index < 0 or page_index >= len(doc):
-                return ""
-            page = doc[page_index]
-            pix = page.get_pixmap(matrix=fitz.Matrix(2, 2), alpha=False)
-            img = Image.frombytes("RGB", [pix.width, pix.height], pix.samples)
-            if max(img.size) > 1800:
-                img.thumbnail((1800, 1800))
-            buf = BytesIO()
-            img.save(buf, format="JPEG", quality=85, optimize=True)
-        return base64.b64encode(buf.getvalue()).decode("ascii")
-
-    @staticmethod
-    def _image_file_to_jpeg_b64(image_path: Path) -> str:
-        img = Image.open(image_path).convert("RGB")
-        if max(img.size) > 1800:
-            img.thumbnail((1800, 1800))
-        buf = BytesIO()
-        img.save(buf, format="JPEG", quality=85, optimize=True)
-        return base64.b64encode(buf.getvalue()).decode("ascii")
-
-    def _describe_image_b64(self, b64: str) -> str:
+    def _render_pdf_page(self, pdf_path: Path, page_index: int):
+        import fitz
+        from PIL import Image
+
+        doc = self.docs.get(pdf_path)
+        if page_index < 0 or page_index >= len(doc):
+            return None
+        page = doc[page_index]
+        pix = page.get_pixmap(matrix=fitz.Matrix(2, 2), alpha=False)
+        return Image.frombytes("RGB", [pix.width, pix.height], pix.samples)
+
+    def pdf_page_image(self, key: str, pdf_path: Path, page_index: int) -> VisionImage | None:
+        img = self._render_pdf_page(pdf_path, page_index)
+        if img is None:
+            return None
+        return VisionImage(key, *_encode_jpeg(img))
+
+    def image_file_image(self, key: str, image_path: Path) -> VisionImage:
+        from PIL import Image
+
+        return VisionImage(key, *_encode_jpeg(Image.open(image_path).convert("RGB")))
+
+    def _describe_image_b64(self, b64: str, tokens: int = 0) -> str:
         if not b64:
             return ""
-        prompt = (
-            "Analyze this study page/image. Extract key ideas, definitions, formulas, "
-            "table/chart findings, and diagram relationships. Keep it concise and factual."
-        )
-        completion = self.client.chat.completions.create(
+        completion = self.ledger.call(
+            "vision",
+            self.client.chat.completions.create,
+            BATCH_PROMPT_TOKENS + tokens,
             model=self.model,
             messages=[
                 {
                     "role": "system",
-                    "content": "You extract learning-relevant visual details from study material.",
+                    "content": SYSTEM_PROMPT,
                 },
                 {
                     "role": "user",
                     "content": [
-                        {"type": "text", "text": prompt},
+                        {"type": "text", "text": ANALYSIS_PROMPT},
                         {
                             "type": "image_url",
                             "image_url": {"url": f"data:image/jpeg;base64,{b64}"},
@@ -67,10 +125,68 @@ class VisionExtractor:
         )
         return (completion.choices[0].message.content or "").strip()
 
-    def describe_pdf_page(self, pdf_path: Path, page_index: int) -> str:
-        b64 = self._render_pdf_page_jpeg_b64(pdf_path, page_index)
-        return self._describe_image_b64(b64)
+    def _plan_batches(self, images: list[VisionImage]) -> list[list[VisionImage]]:
+        batches: list[list[VisionImage]] = []
+        current: list[VisionImage] = []
+        tokens = BATCH_PROMPT_TOKENS
+        for img in images:
+            cost = img.tokens + BATCH_LABEL_TOKENS
+            if current and (len(current) >= self.batch_max_images or tokens + cost > self.batch_max_tokens):
+                batches.append(current)
+                current, tokens = [], BATCH_PROMPT_TOKENS
+            current.append(img)
+            tokens += cost
+        if current:
+            batches.append(current)
+        return batches
+
+    def _describe_batch(self, batch: list[VisionImage]) -> dict[str, str]:
+        # The model sees short ids (p1, p2, ...) instead of our keys, which
+        # hold file paths it might mangle; answers are mapped back here.
+        ids = {f"p{n}": img.key for n, img in enumerate(batch, start=1)}
+        content: list[dict] = [{"type": "text", "text": BATCH_PROMPT}]
+        for short, img in zip(ids, batch):
+            content.append({"type": "text", "text": f"key: {short}"})
+            content.append({"type": "image_url", "image_url": {"url": f"data:image/jpeg;base64,{img.b64}"}})
+        completion = self.ledger.call(
+            "vision",
+            self.client.chat.completions.create,
+            BATCH_PROMPT_TOKENS + sum(img.tokens + BATCH_LABEL_TOKENS for img in batch),
+            model=self.model,
+            messages=[
+                {"role": "system", "content": SYSTEM_PROMPT},
+                {"role": "user", "content": content},
+            ],
+            response_format={"type": "json_object"},
+        )
+        data = json.loads(completion.choices[0].message.content or "{}")
+        rows = data.get("pages") if isinstance(data, dict) else None
+        out = {}
+        for row in rows or []:
+            if isinstance(row, dict) and str(row.get("key") or "").strip() in ids:
+                out[ids[str(row["key"]).strip()]] = str(row.get("analysis") or "").strip()
+        return out
 
-    def describe_image_file(self, image_path: Path) -> str:
-        b64 = self._image_file_to_jpeg_b64(image_path)
-        return self._describe_image_b64(b64)
+    def describe_images(self, images: list[VisionImage], stop=None) -> dict[str, str]:
+        # Packs several images into one request (bounded by vision_batch_max_images
+        # and vision_batch_max_tokens) so the prompts are paid once per batch.
+        # Images a batch answer leaves out, or a batch whose JSON cannot be
+        # used, fall back to one request per image. `stop()` is checked before
+        # each batch; the remaining images are skipped.
+        out: dict[str, str] = {}
+        for batch in self._plan_batches([img for img in images if img.b64]):
+            if stop is not None and stop():
+                break
+            if len(batch) > 1:
+                try:
+                    out.update(self._describe_batch(batch))
+                except Exception:
+                    pass
+            for img in batch:
+                if img.key in out:
+                    continue
+                try:
+                    out[img.key] = self._describe_image_b64(img.b64, img.tokens)
+                except Exception:
+                    out[img.key] = ""
+        return out
@@ -0,0 +1,117 @@
+from __future__ import annotations
+
+from pathlib import Path
+import threading
+from typing import Callable
+
+from .ingest import discover_files
+
+
+def snapshot_content(content_dir: Path) -> dict[str, tuple[int, int]]:
+    snap: dict[str, tuple[int, int]] = {}
+    paths = discover_files(content_dir) if content_dir.exists() else []
+    links = content_dir / "links.txt"
+    if links.exists():
+        paths.append(links)
+    for p in paths:
+        try:
+            st = p.stat()
+        except OSError:
+            continue
+        snap[str(p)] = (st.st_size, st.st_mtime_ns)
+    return snap
+
+
+class ContentWatcher:
+    # Calls on_change once content/ has been quiet for debounce_s after a change.
+    # Uses filesystem events (watchdog) when available and falls back to polling
+    # a (size, mtime) snapshot every poll_s seconds.
+    def __init__(
+        self,
+        content_dir: Path,
+        on_change: Callable[[], None],
+        debounce_s: float = 3.0,
+        poll_s: float = 10.0,
+    ) -> None:
+        self.content_dir = content_dir
+        self.on_change = on_change
+        self.debounce_s = debounce_s
+        self.poll_s = poll_s
+        self._dirty = threading.Event()
+        self._stop = threading.Event()
+        self._observer = None
+        self._thread: threading.Thread | None = None
+
+    def start(self) -> None:
+        self.content_dir.mkdir(parents=True, exist_ok=True)
+        try:
+            self._observer = self._start_observer()
+        except Exception:
+            self._observer = None
+        self._thread = threading.Thread(target=self._loop, name="content-watcher", daemon=True)
+        self._thread.start()
+
+    def stop(self) -> None:
+        self._stop.set()
+        self._dirty.set()
+        if self._observer is not None:
+            try:
+                self._observer.stop()
+                self._observer.join(timeout=5)
+            except Exception:
+                pass
+        if self._thread is not None:
+            self._thread.join(timeout=5)
+
+    def notify(self) -> None:
+        self._dirty.set()
+
+    def _start_observer(self):
+        from watchdog.events import FileSystemEventHandler
+        from watchdog.observers import Observer
+
+        watcher = self
+
+        class _Handler(FileSystemEventHandler):
+            def on_any_event(self, event) -> None:
+                if event.event_type != "opened" and event.event_type != "closed_no_write":
+                    watcher.notify()
+
+        observer = Observer()
+        observer.schedule(_Handler(), str(self.content_dir), recursive=True)
+        observer.daemon = True
+        observer.start()
+        return observer
+
+    def _loop(self) -> None:
+        last = snapshot_content(self.content_dir)
+        while not self._stop.is_set():
+            if self._observer is None:
+                self._dirty.wait(self.poll_s)
+                if self._stop.is_set():
+                    return
+                self._dirty.clear()
+                current = snapshot_content(self.content_dir)
+                if current == last:
+                    continue
+            else:
+                self._dirty.wait()
+                if self._stop.is_set():
+                    return
+            # Debounce: wait until a copy or editor save has finished writing.
+            settled = None
+            while True:
+                self._dirty.clear()
+                if self._stop.wait(self.debounce_s):
+                    return
+                current = snapshot_content(self.content_dir)
+                if not self._dirty.is_set() and current == settled:
+                    break
+                settled = current
+            if current == last:
+                continue
+            last = current
+            try:
+                self.on_change()
+            except Exception:
+                pass